@@ -1,31 +1,59 @@
 from flask import Flask, jsonify
 from flask_cors import CORS
 import os
-
-app = Flask(__name__)
-CORS(app)
-
-from modules.assignment1 import bp as assignment1_bp
-app.register_blueprint(assignment1_bp)
-
-from modules.assignment2 import bp as assignment2_bp
-app.register_blueprint(assignment2_bp)
-
-from modules.assignment3 import bp as assignment3_bp
-app.register_blueprint(assignment3_bp)
-
-from modules.assignment4 import bp as assignment4_bp
-app.register_blueprint(assignment4_bp)
-
-
-
-
-
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    return jsonify({"status": "healthy", "message": "CV Backend is running"})
+import threading
+import multiprocessing
+from modules.common import warmup
+from modules.common.admission import init_admission
+from modules.common.resolution import init_resolution
+from modules.common.lazy import register_modules, load_times
+
+def create_app(modules=None, lazy=None):
+    """Build the app. Assignment modules (CV_MODULES) are imported on first use unless lazy is off."""
+    app = Flask(__name__)
+    CORS(app)
+
+    enabled = register_modules(app, modules, lazy)
+
+    # Per-blueprint concurrency limits, upload size/megapixel limits
+    init_admission(app)
+    # 400 for a malformed max_megapixels override
+    init_resolution(app)
+
+    @app.route('/api/health', methods=['GET'])
+    def health_check():
+        loaded = {name: load_times.get(name) for name in enabled}
+        if not warmup.state["ready"]:
+            return jsonify({"status": "warming", "message": "CV Backend is warming up", "modules": loaded}), 503
+        return jsonify({"status": "healthy", "message": "CV Backend is running",
+                        "warmup_seconds": warmup.state["seconds"], "modules": loaded})
+
+    return app
+
+app = create_app()
+
+# CV_WARMUP:
+#   'lazy' (default)  healthy at once; modules load on first use and a background thread warms them
+#   'background'      warm every module in a background thread, /api/health returns 503 until done
+#   'preload'         gunicorn.conf.py warms everything in the master before forking workers
+#   'off'             no warm-up
+WARMUP_MODE = os.environ.get('CV_WARMUP', 'lazy')
+if WARMUP_MODE in ('lazy', 'off'):
+    warmup.state["ready"] = True
+
+def start_warmup(app):
+    """Start this process's background warm-up, if the mode has one.
+
+    gunicorn.conf.py sets CV_WARMUP_IN_WORKER and calls this from post_fork instead:
+    threads don't survive fork, and a master importing OpenCV while forking could deadlock.
+    """
+    if WARMUP_MODE in ('lazy', 'background') and multiprocessing.parent_process() is None:
+        # Skipped in spawned pool workers, which re-import this module as __mp_main__
+        threading.Thread(target=warmup.run_warmup, args=(app,), daemon=True).start()
+
+if not os.environ.get('CV_WARMUP_IN_WORKER'):
+    start_warmup(app)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(debug=False, host='0.0.0.0', port=port)
-
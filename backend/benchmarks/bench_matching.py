@@ -0,0 +1,74 @@
+"""Spatial vs shared-spectrum FFT template matching across template sizes and counts.
+
+Run from backend/:  python -m benchmarks.bench_matching [--size 1024] [--tpl-sizes 100,200,400] [--counts 1,2,4,8]
+
+Prints the smallest template fraction (template area / image area) at which FFT won for
+every count; set CV_FFT_MIN_TEMPLATE_FRACTION to it to let engine=auto use FFT there.
+"""
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from modules.assignment2.matching import SpectrumMatcher, find_best_match
+
+def synthetic_scene(size, seed=0):
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, (size // 8, size // 8), dtype=np.uint8)
+    img = cv2.resize(noise, (size, size), interpolation=cv2.INTER_CUBIC)
+    return cv2.GaussianBlur(img, (0, 0), 2.0)
+
+def crop_templates(img, count, tpl_size, seed=1):
+    rng = np.random.default_rng(seed)
+    h, w = img.shape
+    templates = []
+    for _ in range(count):
+        y = int(rng.integers(0, h - tpl_size))
+        x = int(rng.integers(0, w - tpl_size))
+        templates.append(img[y:y+tpl_size, x:x+tpl_size].copy())
+    return templates
+
+def run(img, templates, engine):
+    start = time.perf_counter()
+    matcher = SpectrumMatcher(img, engine)
+    results = [find_best_match(img, tpl, matcher=matcher) for tpl in templates]
+    return time.perf_counter() - start, results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--tpl-sizes', default='100,200,400')
+    parser.add_argument('--counts', default='1,2,4,8')
+    args = parser.parse_args()
+
+    img = synthetic_scene(args.size)
+    tpl_sizes = [int(t) for t in args.tpl_sizes.split(',')]
+
+    # Correctness: FFT scores must match TM_CCOEFF_NORMED
+    tpl = crop_templates(img, 1, tpl_sizes[0])[0]
+    ref = cv2.matchTemplate(img, tpl, cv2.TM_CCOEFF_NORMED)
+    fft = SpectrumMatcher(img, 'fft').match(tpl)
+    print(f"max |fft - TM_CCOEFF_NORMED| = {np.abs(ref - fft).max():.2e}")
+
+    print(f"{'tpl':>5} {'fraction':>9} {'templates':>9} {'spatial s':>10} {'fft s':>8} {'speedup':>8}  same best")
+    crossover = None
+    for tpl_size in tpl_sizes:
+        fraction = tpl_size * tpl_size / (args.size * args.size)
+        fft_wins = True
+        for count in [int(c) for c in args.counts.split(',')]:
+            templates = crop_templates(img, count, tpl_size)
+            t_spatial, r_spatial = run(img, templates, 'spatial')
+            t_fft, r_fft = run(img, templates, 'fft')
+            same = all(a[1][:2] == b[1][:2] for a, b in zip(r_spatial, r_fft))
+            fft_wins = fft_wins and t_fft < t_spatial
+            print(f"{tpl_size:>5} {fraction:>9.4f} {count:>9} {t_spatial:>10.3f} {t_fft:>8.3f} {t_spatial / t_fft:>7.2f}x  {same}")
+        if fft_wins and crossover is None:
+            crossover = fraction
+    if crossover is None:
+        print("spatial was faster or tied at every size; leave CV_FFT_MIN_TEMPLATE_FRACTION unset")
+    else:
+        print(f"FFT won at every count from fraction {crossover:.4f}: CV_FFT_MIN_TEMPLATE_FRACTION={crossover:.4f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Cold-start report: time to the first healthy /api/health response, eager vs lazy module loading.
+
+Run from backend/:  python -m benchmarks.bench_startup [--runs 3] [--top 8] [--warmup lazy] [--check]
+
+Each run starts a fresh interpreter under `python -X importtime`, imports app.py and polls
+/api/health through the test client until it returns 200. --warmup preload runs the full
+warm-up before polling, as gunicorn.conf.py's when_ready does in the master. Time is measured
+from process launch, so interpreter start-up is included. The import table lists the slowest top-level
+imports that happened before the app was healthy; module load times are the deferred cost
+each assignment pays on its first request.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEALTHY_MARK = '-- healthy --'
+
+CHILD = f'''
+import os, sys, time, json
+from app import app
+if os.environ['CV_WARMUP'] == 'preload':
+    from modules.common.warmup import run_warmup
+    run_warmup(app)
+client = app.test_client()
+while client.get('/api/health').status_code != 200:
+    time.sleep(0.01)
+healthy_at = time.time()
+heavy = [m for m in ('cv2', 'numpy', 'PIL') if m in sys.modules]
+sys.stderr.write({HEALTHY_MARK!r} + '\\n')
+sys.stderr.flush()
+from modules.common import lazy
+for name in lazy.ENABLED_MODULES:
+    lazy.load(name)
+print(json.dumps({{"healthy_at": healthy_at, "heavy": heavy, "load_times": lazy.load_times}}))
+'''
+
+def parse_importtime(stderr):
+    """Top-level imports before the healthy mark as (cumulative seconds, name)."""
+    rows = []
+    for line in stderr.splitlines():
+        if line.startswith(HEALTHY_MARK):
+            break
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        rows.append((len(name) - len(name.lstrip()), int(cumulative) / 1e6, name.strip()))
+    if not rows:
+        return []
+    top = min(depth for depth, _, _ in rows)
+    return sorted(((cum, name) for depth, cum, name in rows if depth == top), reverse=True)
+
+def run_once(lazy, warmup):
+    env = dict(os.environ, CV_LAZY_MODULES='1' if lazy else '0', CV_WARMUP=warmup)
+    env.pop('CV_WARMUP_IN_WORKER', None)
+    start = time.time()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD], cwd=BACKEND, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["healthy_s"] = result.pop("healthy_at") - start
+    result["imports"] = parse_importtime(proc.stderr)
+    return result
+
+def check():
+    sys.path.insert(0, BACKEND)
+    from modules.common.lazy import MODULES, check_routes
+    drift = {name: check_routes(name) for name in MODULES}
+    for name, problems in drift.items():
+        print(f"{name}: {'ok' if not problems else '; '.join(problems)}")
+    return 1 if any(drift.values()) else 0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=8)
+    parser.add_argument('--warmup', default='lazy', choices=['lazy', 'off', 'background', 'preload'])
+    parser.add_argument('--check', action='store_true', help='only compare the lazy route table with the real blueprints')
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(check())
+
+    reports = {label: [run_once(lazy, args.warmup) for _ in range(args.runs)]
+               for label, lazy in (('eager', False), ('lazy', True))}
+
+    print(f"CV_WARMUP={args.warmup}, {args.runs} runs each")
+    print(f"{'mode':>6} {'healthy s':>10} {'min s':>7}  heavy modules loaded at health")
+    for label, runs in reports.items():
+        times = [r["healthy_s"] for r in runs]
+        print(f"{label:>6} {statistics.median(times):>10.3f} {min(times):>7.3f}  {', '.join(runs[-1]['heavy']) or '-'}")
+
+    for label, runs in reports.items():
+        print(f"\n{label}: slowest top-level imports before healthy")
+        for cumulative, name in runs[-1]["imports"][:args.top]:
+            print(f"  {cumulative:>8.3f}s  {name}")
+        print(f"{label}: module load times")
+        for name, seconds in runs[-1]["load_times"].items():
+            print(f"  {seconds:>8.3f}s  {name}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import multiprocessing
+
+# Production entry point: gunicorn -c gunicorn.conf.py app:app
+
+cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', max(1, min(cpus, int(os.environ.get('GUNICORN_MAX_WORKERS', 4))))))
+# CPU-heavy concurrency is capped by modules/common/admission.py, not by the thread count.
+# Admission also keeps gated requests (running or queued) below this many threads, leaving
+# CV_LIGHT_THREADS free so /api/health and other light routes are never stuck behind them.
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+os.environ.setdefault('CV_WORKER_THREADS', str(threads))
+worker_class = 'gthread'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = True
+
+# Split the cores between workers so OpenCV and BLAS pools don't oversubscribe the box.
+# The BLAS variables must be set before NumPy is imported, i.e. before the app is preloaded.
+cv_threads = int(os.environ.get('CV_NUM_THREADS', max(1, cpus // workers)))
+os.environ.setdefault('CV_NUM_THREADS', str(cv_threads))  # applied by modules.common.lazy on first import
+for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS'):
+    os.environ.setdefault(var, str(cv_threads))
+
+# Warm-up (see app.py). Default 'lazy': workers are healthy as soon as they start and warm
+# their modules in a background thread, so a woken-up instance answers /api/health without
+# importing OpenCV first. 'preload' warms once in the master before forking instead: slower
+# to first response, but workers start fully warm and share the imported pages.
+os.environ.setdefault('CV_WARMUP', 'lazy')
+os.environ['CV_WARMUP_IN_WORKER'] = '1'
+
+def when_ready(server):
+    if os.environ['CV_WARMUP'] == 'preload':
+        import cv2
+        cv2.setNumThreads(cv_threads)
+        from modules.common.warmup import run_warmup
+        state = run_warmup(server.app.wsgi())
+        server.log.info("Warm-up finished in %ss, failures: %s", state["seconds"], state["failures"] or "none")
+        # Workers start their own SIFT process pool on first use; don't keep the master's around
+        from modules.assignment4.parallel import shutdown_pool
+        shutdown_pool()
+
+def post_fork(server, worker):
+    # OpenCV's thread pool does not survive fork; re-apply the per-worker size.
+    # Not imported here if nothing loaded it yet: lazy modules apply it when they import OpenCV.
+    if 'cv2' in sys.modules:
+        sys.modules['cv2'].setNumThreads(cv_threads)
+    # Background warm-up ('lazy'/'background') runs per worker; its thread can't be inherited
+    from app import start_warmup
+    start_warmup(server.app.wsgi())
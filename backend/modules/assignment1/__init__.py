@@ -1,6 +1,8 @@
 import os
 import cv2
+import json
 import math
+import threading
 import numpy as np
 from flask import Blueprint, jsonify, request, current_app
 from werkzeug.utils import secure_filename
@@ -10,12 +12,55 @@ bp = Blueprint('assignment1', __name__, url_prefix='/api/assignment1')
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Stored focal calibrations (f_px, optional 3x3 intrinsic matrix, units), one JSON file per id.
+# On disk rather than in memory so every gunicorn worker sees every calibration.
+CALIBRATION_FOLDER = os.environ.get('CV_CALIBRATION_DIR', 'calibrations')
+
+def calibration_path(calibration_id):
+    if not isinstance(calibration_id, str) or not calibration_id or secure_filename(calibration_id) != calibration_id:
+        raise ValueError("Calibration id may only contain letters, digits, '-', '_' and '.'")
+    return os.path.join(CALIBRATION_FOLDER, calibration_id + '.json')
+
+def save_calibration(calibration_id, calib):
+    path = calibration_path(calibration_id)
+    os.makedirs(CALIBRATION_FOLDER, exist_ok=True)
+    # Write then rename, so concurrent readers never see a partial file
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(calib, f)
+    os.replace(tmp, path)
+
+def check_calibration(calib):
+    """Raise ValueError unless the focal lengths /measure divides by are finite and positive."""
+    focals = {'f_px': calib['f_px']}
+    if calib.get('camera_matrix') is not None:
+        matrix = calib['camera_matrix']
+        if not all(math.isfinite(v) for row in matrix for v in row):
+            raise ValueError("camera_matrix entries must be finite")
+        focals.update(fx=matrix[0][0], fy=matrix[1][1])
+    for name, value in focals.items():
+        if not (math.isfinite(value) and value > 0):
+            raise ValueError(f"{name} must be finite and positive, got {value}")
+
+def load_calibration(calibration_id):
+    try:
+        with open(calibration_path(calibration_id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg'}
 
 def get_distance(p1, p2):
     return math.sqrt((p1[0] - p2[0])**2 + (p1[1] - p2[1])**2)
 
+def parse_points(points):
+    # Accept "x1,y1,x2,y2" or [x1, y1, x2, y2]
+    if isinstance(points, str):
+        points = points.split(',')
+    return [float(v) for v in points]
+
 @bp.route('/process', methods=['POST'])
 def process():
     try:
@@ -59,6 +104,15 @@ def process():
         
         L_img_px_test = get_distance(p1t, p2t)
         L_pred = (L_img_px_test * test_distance) / f_px
+        
+        # Optionally keep the calibration for later batch measurements
+        if data.get('calibration_id'):
+            try:
+                calib = {'f_px': f_px, 'camera_matrix': None, 'units': data.get('units', 'cm')}
+                check_calibration(calib)
+                save_calibration(data['calibration_id'], calib)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
 
         # Annotate images (optional, but good for display)
         # We can return the result directly
@@ -71,3 +125,106 @@ def process():
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/calibrations', methods=['POST'])
+def create_calibration():
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a JSON object"}), 400
+        calibration_id = data.get('id', 'default')
+        
+        try:
+            camera_matrix = data.get('camera_matrix')
+            if camera_matrix is not None:
+                camera_matrix = np.array(camera_matrix, dtype=np.float64).reshape(3, 3)
+            
+            if 'f_px' in data:
+                f_px = float(data['f_px'])
+            elif 'calib_points' in data:
+                # Same relation as /process: f = L_img * Z / L_real
+                x1, y1, x2, y2 = parse_points(data['calib_points'])
+                f_px = get_distance((x1, y1), (x2, y2)) * float(data['calib_distance']) / float(data['calib_size'])
+            elif camera_matrix is not None:
+                f_px = float((camera_matrix[0, 0] + camera_matrix[1, 1]) / 2)
+            else:
+                return jsonify({"error": "Provide f_px, calib_points or camera_matrix"}), 400
+            
+            calib = {
+                'f_px': f_px,
+                'camera_matrix': camera_matrix.tolist() if camera_matrix is not None else None,
+                'units': data.get('units', 'cm')
+            }
+            check_calibration(calib)
+            save_calibration(calibration_id, calib)
+        except (ValueError, TypeError, KeyError, ZeroDivisionError) as e:
+            return jsonify({"error": f"Invalid calibration: {e}"}), 400
+        return jsonify({"id": calibration_id, **calib})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/calibrations/<calibration_id>', methods=['GET'])
+def get_calibration(calibration_id):
+    try:
+        calib = load_calibration(calibration_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if calib is None:
+        return jsonify({"error": "Calibration not found"}), 404
+    return jsonify({"id": calibration_id, **calib})
+
+@bp.route('/measure', methods=['POST'])
+def measure_batch():
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a JSON object"}), 400
+        if 'segments' not in data or 'distances' not in data:
+            return jsonify({"error": "Provide segments and distances"}), 400
+        
+        try:
+            calib = load_calibration(data.get('calibration_id', 'default'))
+            if calib is not None:
+                # Calibrations stored before validation existed may hold a zero or negative focal length
+                check_calibration(calib)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if calib is None:
+            return jsonify({"error": "Calibration not found"}), 404
+        
+        # segments: list of "x1,y1,x2,y2" or [x1, y1, x2, y2]; distances: one per segment or a single value
+        try:
+            if not isinstance(data['segments'], list):
+                raise ValueError("segments must be a list")
+            if not data['segments']:
+                raise ValueError("no segments to measure")
+            segments = np.array([parse_points(s) for s in data['segments']], dtype=np.float64)
+            if segments.ndim != 2 or segments.shape[1] != 4:
+                raise ValueError("each segment needs exactly 4 coordinates")
+            distances = np.asarray(data['distances'], dtype=np.float64)
+            if distances.ndim > 1 or (distances.ndim == 1 and len(distances) != len(segments)):
+                raise ValueError(f"expected 1 or {len(segments)} distances, got {distances.size}")
+            distances = np.broadcast_to(distances, (len(segments),))
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": f"Invalid measurement request: {e}"}), 400
+        
+        # All segments in one pass: L = Z * |p2 - p1| / f, with per-axis focal lengths when
+        # a full intrinsic matrix was stored
+        if calib['camera_matrix'] is not None:
+            fx, fy = calib['camera_matrix'][0][0], calib['camera_matrix'][1][1]
+        else:
+            fx = fy = calib['f_px']
+        dx = (segments[:, 2] - segments[:, 0]) / fx
+        dy = (segments[:, 3] - segments[:, 1]) / fy
+        lengths = np.hypot(dx, dy) * distances
+        
+        return jsonify({
+            "lengths": lengths.tolist(),
+            "f_px": calib['f_px'],
+            "units": data.get('units', calib['units'])
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -2,9 +2,15 @@ import os
 import cv2
 import numpy as np
 import glob
+import json
 from flask import Blueprint, jsonify, request, send_file
 from werkzeug.utils import secure_filename
 import base64
+from .matching import find_best_match, SpectrumMatcher, SCALES, ANGLES, ENGINES, DEFAULT_ENGINE
+from .tracking import TemplateTracker, get_tracker, CV_TRACKERS, cv_tracker_available
+from .deconvolution import richardson_lucy, blind_richardson_lucy
+from modules.common.memory import decode_upload, allocate
+from modules.common.resolution import request_budget, fit, box_to_original
 
 bp = Blueprint('assignment2', __name__, url_prefix='/api/assignment2')
 
@@ -15,15 +21,15 @@ os.makedirs(TEMPLATE_FOLDER, exist_ok=True)
 
 # --- Template Matching Logic ---
 
-def rotate_keep_all(tpl, angle):
-    rows, cols = tpl.shape[:2]
-    M = cv2.getRotationMatrix2D((cols/2, rows/2), angle, 1.0)
-    cos, sin = abs(M[0,0]), abs(M[0,1])
-    nW = int(rows*sin + cols*cos)
-    nH = int(rows*cos + cols*sin)
-    M[0,2] += (nW/2) - cols/2
-    M[1,2] += (nH/2) - rows/2
-    return cv2.warpAffine(tpl, M, (nW, nH), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+COLORS = [(0,255,0),(0,180,255),(255,160,0),(255,0,120),(120,255,120),(160,120,255),(200,200,0),(0,220,180)]
+
+def load_templates():
+    templates = []
+    for tpath in sorted(glob.glob(os.path.join(TEMPLATE_FOLDER, '*.JPG'))):
+        tpl = cv2.imread(tpath, cv2.IMREAD_GRAYSCALE)
+        if tpl is None: continue
+        templates.append((os.path.splitext(os.path.basename(tpath))[0], tpl))
+    return templates
 
 @bp.route('/match', methods=['POST'])
 def match_templates():
@@ -42,52 +48,35 @@ def match_templates():
         if img_gray is None:
             return jsonify({"error": "Could not read image"}), 400
 
-        # Parameters
-        method = cv2.TM_CCOEFF_NORMED
-        scales = np.linspace(0.5, 1.4, 19)
-        angles = [0, 180]
         score_thresh = float(request.form.get('threshold', 0.60))
+        engine = request.form.get('engine', DEFAULT_ENGINE)
+        if engine not in ENGINES:
+            return jsonify({"error": f"Unknown matching engine '{engine}' (expected {', '.join(ENGINES)})"}), 400
         
-        template_paths = sorted(glob.glob(os.path.join(TEMPLATE_FOLDER, '*.JPG')))
-        results = []
+        # Search at the resolution budget; template scales shrink with the image so reported
+        # scales and boxes stay relative to the original upload
+        work, f = fit(img_gray, request_budget())
         
-        colors = [(0,255,0),(0,180,255),(255,160,0),(255,0,120),(120,255,120),(160,120,255),(200,200,0),(0,220,180)]
+        # One image spectrum shared by every template variant
+        matcher = SpectrumMatcher(work, engine)
         
-        for idx, tpath in enumerate(template_paths):
-            tpl = cv2.imread(tpath, cv2.IMREAD_GRAYSCALE)
-            if tpl is None: continue
-            
-            best_score, best = -1.0, None
-            
-            for ang in angles:
-                tpl_rot = rotate_keep_all(tpl, ang)
-                for s in scales:
-                    tw = max(5, int(tpl_rot.shape[1]*s))
-                    th = max(5, int(tpl_rot.shape[0]*s))
-                    
-                    if tw >= img_gray.shape[1] or th >= img_gray.shape[0]:
-                        continue
-                        
-                    tpl_scaled = cv2.resize(tpl_rot, (tw, th), interpolation=cv2.INTER_AREA)
-                    res = cv2.matchTemplate(img_gray, tpl_scaled, method)
-                    _, max_val, _, max_loc = cv2.minMaxLoc(res)
-                    
-                    if max_val > best_score:
-                        best_score = max_val
-                        best = (max_loc, (tw, th), s, ang)
+        results = []
+        
+        for idx, (name, tpl) in enumerate(load_templates()):
+            best_score, best = find_best_match(work, tpl, SCALES * f, ANGLES, matcher=matcher)
             
             if best and best_score >= score_thresh:
                 (x,y), (w,h), s, ang = best
-                name = os.path.splitext(os.path.basename(tpath))[0]
+                x, y, w, h = box_to_original((x, y, w, h), f)
                 results.append({
                     "name": name,
                     "score": float(best_score),
-                    "box": [int(x), int(y), int(w), int(h)],
-                    "scale": float(s),
+                    "box": [x, y, w, h],
+                    "scale": float(s / f),
                     "angle": int(ang)
                 })
                 
-                color = colors[idx % len(colors)]
+                color = COLORS[idx % len(COLORS)]
                 cv2.rectangle(img_bgr, (x,y), (x+w, y+h), color, 2)
                 cv2.putText(img_bgr, f"{name} {best_score:.2f}", (x, max(15, y-6)), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.55, color, 1, cv2.LINE_AA)
@@ -104,6 +93,77 @@ def match_templates():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@bp.route('/track', methods=['POST'])
+def track_templates():
+    try:
+        if 'image' not in request.files:
+            return jsonify({"error": "No image uploaded"}), 400
+        
+        # Video frames arrive in quick succession, so decode in memory instead of saving to disk
+        data = np.frombuffer(request.files['image'].read(), np.uint8)
+        img_bgr = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if img_bgr is None:
+            return jsonify({"error": "Could not read image"}), 400
+        img_gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+        
+        # Parameters
+        session_id = request.form.get('session_id', 'default')
+        reset = request.form.get('reset') == 'true'
+        score_thresh = float(request.form.get('threshold', 0.60))
+        cv_tracker = request.form.get('tracker', 'none').lower()
+        redetect_interval = max(1, int(request.form.get('redetect_interval', 10)))
+        # The previous response's "state", sent back so any worker can continue the session
+        state = None
+        if request.form.get('state'):
+            try:
+                state = json.loads(request.form['state'])
+            except ValueError:
+                return jsonify({"error": "state must be the JSON object returned with the previous frame"}), 400
+            if not isinstance(state, dict):
+                return jsonify({"error": "state must be the JSON object returned with the previous frame"}), 400
+        if cv_tracker != 'none':
+            if cv_tracker not in CV_TRACKERS:
+                return jsonify({"error": f"Unknown tracker '{cv_tracker}' (expected none, {', '.join(CV_TRACKERS)})"}), 400
+            if not cv_tracker_available(cv_tracker):
+                return jsonify({"error": f"Tracker '{cv_tracker}' needs an OpenCV build with the contrib modules "
+                                         "(opencv-contrib-python-headless)"}), 400
+        
+        try:
+            tracker, source = get_tracker(session_id, lambda: TemplateTracker(
+                load_templates(),
+                threshold=score_thresh,
+                cv_tracker=None if cv_tracker == 'none' else cv_tracker,
+                redetect_interval=redetect_interval
+            ), reset=reset, state=state)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        tracker.threshold = score_thresh
+        
+        detections, stats = tracker.update(img_bgr, img_gray)
+        stats["session"] = source
+        
+        names = [name for name, _ in tracker.templates]
+        for det in detections:
+            x, y, w, h = det["box"]
+            color = COLORS[names.index(det["name"]) % len(COLORS)]
+            cv2.rectangle(img_bgr, (x,y), (x+w, y+h), color, 2)
+            cv2.putText(img_bgr, f"{det['name']} {det['score']:.2f} [{det['mode']}]", (x, max(15, y-6)),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.55, color, 1, cv2.LINE_AA)
+        
+        _, buffer = cv2.imencode('.jpg', img_bgr)
+        img_str = base64.b64encode(buffer).decode('utf-8')
+        
+        return jsonify({
+            "detections": detections,
+            "frame": tracker.frame_idx,
+            "stats": stats,
+            "state": tracker.to_state(),
+            "image": f"data:image/jpeg;base64,{img_str}"
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # --- Deblurring Logic ---
 
 def gaussian_psf(ksize, sigma):
@@ -122,65 +182,141 @@ def psf_to_otf(psf, shapeHW):
 def wiener_deconv(G, H, K): return (np.conj(H)/(np.abs(H)**2 + K)) * G
 def inverse_deconv(G, H, eps=1e-6): return G / (H + eps)
 
+def psf_to_spectrum(psf, shapeHW, out):
+    """Same OTF as psf_to_otf, as a 2-channel float32 spectrum written into out (H, W, 2)."""
+    H, W = shapeHW
+    pad = np.zeros((H, W), np.float32)
+    pad[:psf.shape[0], :psf.shape[1]] = np.fft.ifftshift(psf)
+    return cv2.dft(pad, out, flags=cv2.DFT_COMPLEX_OUTPUT)
+
+def deconv_filter(otf, mode, K, eps=1e-6):
+    """Turn an OTF spectrum into the per-frequency recovery filter, in place.
+
+    Wiener: conj(H) / (|H|^2 + K). Inverse: 1 / (H + eps) = conj(H + eps) / |H + eps|^2.
+    Computing it once lets all channels share it via cv2.mulSpectrums.
+    """
+    re, im = otf[..., 0], otf[..., 1]
+    if mode != "wiener":
+        re += eps
+        K = 0.0
+    d = np.square(re)
+    d += np.square(im)
+    d += K
+    np.divide(re, d, out=re)
+    np.divide(im, d, out=im)
+    np.negative(im, out=im)
+    return otf
+
+# Working set per pixel by mode: planar float32 original/blurred/recovered (36 B), plus
+#   wiener/inverse: filter and channel spectra (2 x complex64)
+#   rl:       padded observed and estimate planes (2 x 12 B), OTF and channel spectra, a scratch plane
+#   blind_rl: as rl plus the image spectrum, PSF and PSF accumulator planes
+DEBLUR_BYTES_PER_PIXEL = {'wiener': 36 + 16, 'rl': 36 + 24 + 16 + 4, 'blind_rl': 36 + 24 + 24 + 12}
+
 @bp.route('/deblur', methods=['POST'])
 def deblur_image():
     try:
         if 'image' not in request.files:
             return jsonify({"error": "No image uploaded"}), 400
-            
-        file = request.files['image']
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
         
-        img = cv2.imread(filepath)
+        mode = request.form.get('mode', 'wiener')
+        
+        # Large uploads are spooled to memory-mapped buffers when the working set exceeds the budget
+        img, memmap = decode_upload(request.files['image'],
+                                    working_bytes_per_pixel=DEBLUR_BYTES_PER_PIXEL.get(mode, DEBLUR_BYTES_PER_PIXEL['wiener']))
         if img is None:
             return jsonify({"error": "Could not read image"}), 400
             
         # Parameters
         sigma = float(request.form.get('sigma', 3.0))
         ksize = int(request.form.get('ksize', 19))
-        mode = request.form.get('mode', 'wiener')
         k_wiener = float(request.form.get('k_wiener', 0.01))
         region_blur = request.form.get('region_blur') == 'true'
         
         if ksize % 2 == 0: ksize += 1
         
-        L = img.astype(np.float32) / 255.0
+        # Channel-planar buffers keep each channel contiguous so OpenCV can write into them directly
+        Hh, Ww = img.shape[:2]
+        L = allocate((3, Hh, Ww), np.float32, memmap)
+        for c in range(3):
+            np.multiply(img[:,:,c], 1.0/255.0, out=L[c], casting='unsafe')
         
-        # Create PSF/OTF
+        # Create PSF
         psf = gaussian_psf(ksize, sigma)
-        Hh, Ww = L.shape[:2]
-        OTF = psf_to_otf(psf, (Hh, Ww))
         
         # 1. Blur
+        L_b = allocate((3, Hh, Ww), np.float32, memmap)
         if region_blur:
             # Blur only a central region
-            L_b = L.copy()
+            np.copyto(L_b, L)
             cy, cx = Hh // 2, Ww // 2
             rh, rw = Hh // 3, Ww // 3
-            roi = L[cy-rh:cy+rh, cx-rw:cx+rw]
-            roi_b = np.stack([cv2.filter2D(roi[:,:,c], -1, psf, borderType=cv2.BORDER_REFLECT) for c in range(3)], axis=2)
-            L_b[cy-rh:cy+rh, cx-rw:cx+rw] = roi_b
+            for c in range(3):
+                L_b[c, cy-rh:cy+rh, cx-rw:cx+rw] = cv2.filter2D(L[c, cy-rh:cy+rh, cx-rw:cx+rw], -1, psf, borderType=cv2.BORDER_REFLECT)
         else:
-            L_b = np.stack([cv2.filter2D(L[:,:,c], -1, psf, borderType=cv2.BORDER_REFLECT) for c in range(3)], axis=2)
+            for c in range(3):
+                cv2.filter2D(L[c], -1, psf, dst=L_b[c], borderType=cv2.BORDER_REFLECT)
         
         # 2. Recover
-        L_rec = np.zeros_like(L)
-        for c in range(3):
-            G = np.fft.fft2(L_b[:,:,c])
-            Fhat = wiener_deconv(G, OTF, k_wiener) if mode=="wiener" else inverse_deconv(G, OTF, 1e-6)
-            L_rec[:,:,c] = np.clip(np.fft.ifft2(Fhat).real, 0.0, 1.0)
+        L_rec = allocate((3, Hh, Ww), np.float32, memmap)
+        extra = {}
+        if mode in ('rl', 'blind_rl'):
+            max_iter = int(request.form.get('iterations', 30))
+            tol = float(request.form.get('tol', 1e-3))
+            time_budget = float(request.form.get('time_budget', 10.0))
+            # Every RL buffer comes from the same RAM/memmap allocator as the planes above
+            alloc = lambda shape, dtype: allocate(shape, dtype, memmap)
+            # Reflect-pad by the PSF size so circular convolution doesn't wrap edges
+            observed = alloc((3, Hh + 2*ksize, Ww + 2*ksize), np.float32)
+            for c in range(3):
+                cv2.copyMakeBorder(L_b[c], ksize, ksize, ksize, ksize, cv2.BORDER_REFLECT_101, dst=observed[c])
+            if mode == 'rl':
+                est, progress = richardson_lucy(observed, psf, max_iter, tol, time_budget, alloc=alloc)
+            else:
+                # Start from the known Gaussian. From a flat box the PSF estimate converges too
+                # slowly: within the iteration budget the result is still further from the
+                # sharp image than the blurred input is.
+                if request.form.get('psf_init', 'gaussian') == 'flat':
+                    psf_init = np.full((ksize, ksize), 1.0 / (ksize * ksize), np.float32)
+                else:
+                    psf_init = psf
+                est, psf_est, progress = blind_richardson_lucy(observed, psf_init, max_iter, tol, time_budget, alloc=alloc)
+                psf_vis = cv2.convertScaleAbs(psf_est, alpha=255.0 / max(float(psf_est.max()), 1e-12))
+                psf_vis = cv2.resize(psf_vis, (128, 128), interpolation=cv2.INTER_NEAREST)
+                _, buf = cv2.imencode('.png', psf_vis)
+                extra["psf"] = "data:image/png;base64," + base64.b64encode(buf).decode('utf-8')
+            np.clip(est[:, ksize:ksize+Hh, ksize:ksize+Ww], 0.0, 1.0, out=L_rec)
+            extra["progress"] = progress.history
+            extra["stop_reason"] = progress.stop_reason
+        else:
+            # One-shot filter shared by all channels
+            filt = psf_to_spectrum(psf, (Hh, Ww), allocate((Hh, Ww, 2), np.float32, memmap))
+            filt = deconv_filter(filt, mode, k_wiener)
+            G = allocate((Hh, Ww, 2), np.float32, memmap)
+            for c in range(3):
+                cv2.dft(L_b[c], G, flags=cv2.DFT_COMPLEX_OUTPUT)
+                cv2.mulSpectrums(G, filt, 0, G)
+                cv2.idft(G, L_rec[c], flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+                np.clip(L_rec[c], 0.0, 1.0, out=L_rec[c])
             
         # Encode images
-        def encode(img_arr):
-            _, buf = cv2.imencode('.jpg', np.clip(img_arr*255, 0, 255).astype(np.uint8))
+        def encode(img_u8):
+            _, buf = cv2.imencode('.jpg', img_u8)
             return "data:image/jpeg;base64," + base64.b64encode(buf).decode('utf-8')
+        
+        def to_u8(planes):
+            # Truncate like the original clip(x*255).astype(uint8); convertScaleAbs would round
+            out = np.empty(planes.shape[1:] + (3,), np.uint8)
+            for c in range(3):
+                np.multiply(planes[c], 255.0, out=out[:,:,c], casting='unsafe')
+            return out
             
         return jsonify({
-            "original": encode(L),
-            "blurred": encode(L_b),
-            "recovered": encode(L_rec)
+            "original": encode(img),
+            "blurred": encode(to_u8(L_b)),
+            "recovered": encode(to_u8(L_rec)),
+            "storage": "memmap" if memmap else "ram",
+            **extra
         })
 
     except Exception as e:
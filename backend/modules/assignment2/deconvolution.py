@@ -0,0 +1,147 @@
+import time
+
+import cv2
+import numpy as np
+
+# Iterative deconvolution on channel-planar (C, H, W) float32 stacks. Every convolution is a
+# product in the frequency domain. Spectra are OpenCV complex (H, W, 2) float32 buffers,
+# taken once per call from `alloc` (np.empty, or a memory-mapped allocator for large images)
+# and reused channel by channel, so the working set is a fixed number of planes.
+
+DFT = cv2.DFT_COMPLEX_OUTPUT
+IDFT = cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT
+
+def _wrap_index(k, n):
+    # Rows (or columns) of a k-tap kernel centred on the origin of an n-periodic grid
+    return (np.arange(k) - k // 2) % n
+
+def embed_psf(psf, shape, out=None):
+    """Place a k x k PSF in an H x W array with its centre at the origin (wrapped), as circular convolution expects."""
+    out = np.zeros(shape, np.float32) if out is None else out
+    out.fill(0)
+    kh, kw = psf.shape
+    out[np.ix_(_wrap_index(kh, shape[0]), _wrap_index(kw, shape[1]))] = psf
+    return out
+
+def crop_psf(full, ksize):
+    """Inverse of embed_psf: the k x k PSF around the origin of a full-size array (a copy)."""
+    kh, kw = ksize
+    return full[np.ix_(_wrap_index(kh, full.shape[0]), _wrap_index(kw, full.shape[1]))]
+
+def psf_to_otf(psf, shape, alloc=np.empty):
+    """OTF of a centred PSF as an OpenCV complex spectrum."""
+    plane = embed_psf(psf, shape, alloc(shape, np.float32))
+    return cv2.dft(plane, alloc(shape + (2,), np.float32), flags=DFT)
+
+class Progress:
+    """Per-iteration log with convergence and budget checks."""
+
+    def __init__(self, max_iter, tol, time_budget=None, callback=None):
+        self.max_iter = max_iter
+        self.tol = tol
+        self.time_budget = time_budget
+        self.callback = callback
+        self.start = time.perf_counter()
+        self.history = []
+        self.stop_reason = 'max_iter'
+
+    def step(self, iteration, change):
+        """Record one iteration; returns True when the loop should stop."""
+        elapsed = time.perf_counter() - self.start
+        entry = {"iteration": iteration, "change": float(change), "elapsed": round(elapsed, 4)}
+        self.history.append(entry)
+        if self.callback:
+            self.callback(entry)
+        if change < self.tol:
+            self.stop_reason = 'converged'
+        elif self.time_budget and elapsed >= self.time_budget:
+            self.stop_reason = 'time_budget'
+        else:
+            return iteration >= self.max_iter
+        return True
+
+def _blur_ratio(est_c, observed_c, otf, spec, scratch, eps, blur_spec=None):
+    """scratch = observed / (est * psf), clamped away from zero.
+
+    The blurred spectrum goes to blur_spec; with a separate buffer, spec keeps est's own
+    spectrum for the caller, otherwise it is overwritten.
+    """
+    blur_spec = spec if blur_spec is None else blur_spec
+    cv2.dft(est_c, spec, flags=DFT)
+    cv2.mulSpectrums(spec, otf, 0, blur_spec)
+    cv2.idft(blur_spec, scratch, flags=IDFT)
+    np.maximum(scratch, eps, out=scratch)
+    np.divide(observed_c, scratch, out=scratch)
+
+def _rl_update(est, observed, otf, spec, scratch, eps):
+    """One RL image step in place; returns the relative change of the estimate."""
+    corr_sq = est_sq = 0.0
+    for c in range(est.shape[0]):
+        _blur_ratio(est[c], observed[c], otf, spec, scratch, eps)
+        cv2.dft(scratch, spec, flags=DFT)
+        cv2.mulSpectrums(spec, otf, 0, spec, conjB=True)
+        cv2.idft(spec, scratch, flags=IDFT)
+        scratch -= 1.0
+        scratch *= est[c]
+        corr_sq += cv2.norm(scratch, cv2.NORM_L2SQR)
+        est_sq += cv2.norm(est[c], cv2.NORM_L2SQR)
+        est[c] += scratch  # est * ratio-correlation
+    return np.sqrt(corr_sq) / (np.sqrt(est_sq) + eps)
+
+def richardson_lucy(observed, psf, max_iter=30, tol=1e-3, time_budget=None, callback=None, eps=1e-7, alloc=np.empty):
+    """Richardson-Lucy with a fixed PSF. observed is (C, H, W) in [0, 1].
+
+    The OTF is computed once and reused by every iteration.
+    Returns (estimate, progress).
+    """
+    shape = observed.shape[-2:]
+    otf = psf_to_otf(psf, shape, alloc)
+    spec = alloc(shape + (2,), np.float32)
+    scratch = alloc(shape, np.float32)
+    est = alloc(observed.shape, np.float32)
+    np.copyto(est, observed)
+    progress = Progress(max_iter, tol, time_budget, callback)
+    for it in range(1, max_iter + 1):
+        change = _rl_update(est, observed, otf, spec, scratch, eps)
+        if progress.step(it, change):
+            break
+    return est, progress
+
+def blind_richardson_lucy(observed, psf_init, max_iter=20, tol=1e-3, time_budget=None, callback=None, eps=1e-7, alloc=np.empty):
+    """Blind RL: alternate a PSF update and an image update each iteration.
+
+    The PSF stays non-negative, sums to one and is confined to psf_init's k x k support.
+    Returns (estimate, psf, progress) with psf at psf_init's size.
+    """
+    shape = observed.shape[-2:]
+    ksize = psf_init.shape
+    psf = embed_psf(psf_init.astype(np.float32), shape, alloc(shape, np.float32))
+    acc = alloc(shape, np.float32)
+    otf = alloc(shape + (2,), np.float32)
+    img_spec = alloc(shape + (2,), np.float32)
+    spec = alloc(shape + (2,), np.float32)
+    scratch = alloc(shape, np.float32)
+    est = alloc(observed.shape, np.float32)
+    np.copyto(est, observed)
+    progress = Progress(max_iter, tol, time_budget, callback)
+    for it in range(1, max_iter + 1):
+        # PSF step: correlate the data ratio with the current image, summed over channels
+        cv2.dft(psf, otf, flags=DFT)
+        acc.fill(0)
+        for c in range(est.shape[0]):
+            _blur_ratio(est[c], observed[c], otf, img_spec, scratch, eps, blur_spec=spec)
+            cv2.dft(scratch, spec, flags=DFT)
+            cv2.mulSpectrums(spec, img_spec, 0, spec, conjB=True)
+            cv2.idft(spec, scratch, flags=IDFT)
+            acc += scratch
+        small = crop_psf(psf, ksize) * crop_psf(acc, ksize)
+        np.maximum(small, 0.0, out=small)
+        small /= max(float(small.sum()), eps)
+        embed_psf(small, shape, psf)
+
+        # Image step with the updated PSF
+        cv2.dft(psf, otf, flags=DFT)
+        change = _rl_update(est, observed, otf, spec, scratch, eps)
+        if progress.step(it, change):
+            break
+    return est, crop_psf(psf, ksize), progress
@@ -0,0 +1,133 @@
+import os
+
+import cv2
+import numpy as np
+
+# Default search space used by full (non-tracking) detection
+SCALES = np.linspace(0.5, 1.4, 19)
+ANGLES = [0, 180]
+
+ENGINES = ('spatial', 'fft', 'auto')
+
+# OpenCV's matchTemplate already correlates large templates blockwise in the frequency
+# domain, and benchmarks/bench_matching.py measures it faster than the shared-spectrum
+# path at every template size and count it sweeps. So 'spatial' is the default and 'auto'
+# only switches to FFT when CV_FFT_MIN_TEMPLATE_FRACTION is set, i.e. when the benchmark
+# finds a crossover (template area / image area) on the deployment hardware.
+DEFAULT_ENGINE = os.environ.get('CV_MATCH_ENGINE', 'spatial')
+FFT_MIN_TEMPLATE_FRACTION = float(os.environ['CV_FFT_MIN_TEMPLATE_FRACTION']) if os.environ.get('CV_FFT_MIN_TEMPLATE_FRACTION') else None
+
+def rotate_keep_all(tpl, angle):
+    rows, cols = tpl.shape[:2]
+    M = cv2.getRotationMatrix2D((cols/2, rows/2), angle, 1.0)
+    cos, sin = abs(M[0,0]), abs(M[0,1])
+    nW = int(rows*sin + cols*cos)
+    nH = int(rows*cos + cols*sin)
+    M[0,2] += (nW/2) - cols/2
+    M[1,2] += (nH/2) - rows/2
+    return cv2.warpAffine(tpl, M, (nW, nH), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+class SpectrumMatcher:
+    """TM_CCOEFF_NORMED against one search image, sharing its spectrum across templates.
+
+    The image's DFT and integral images (local sum / sum of squares) are computed once;
+    each template variant then costs one forward DFT, a spectrum product and one inverse
+    DFT. engine is 'fft', 'spatial' (cv2.matchTemplate) or 'auto' (chosen per template size).
+    """
+
+    def __init__(self, img_gray, engine=DEFAULT_ENGINE):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown matching engine: {engine}")
+        self.img = img_gray
+        self.engine = engine
+        self.dft_shape = (cv2.getOptimalDFTSize(img_gray.shape[0]), cv2.getOptimalDFTSize(img_gray.shape[1]))
+        self._spectrum = None
+        self._integrals = None
+
+    def use_fft(self, th, tw):
+        if self.engine != 'auto':
+            return self.engine == 'fft'
+        if FFT_MIN_TEMPLATE_FRACTION is None:
+            return False
+        return th * tw >= FFT_MIN_TEMPLATE_FRACTION * self.img.shape[0] * self.img.shape[1]
+
+    def match(self, tpl):
+        th, tw = tpl.shape[:2]
+        if not self.use_fft(th, tw):
+            return cv2.matchTemplate(self.img, tpl, cv2.TM_CCOEFF_NORMED)
+        return self._match_fft(tpl)
+
+    @property
+    def spectrum(self):
+        if self._spectrum is None:
+            # float32 transforms, as OpenCV's own crossCorr uses for 8-bit images
+            pad = np.zeros(self.dft_shape, np.float32)
+            pad[:self.img.shape[0], :self.img.shape[1]] = self.img
+            self._spectrum = cv2.dft(pad)
+        return self._spectrum
+
+    @property
+    def integrals(self):
+        if self._integrals is None:
+            self._integrals = cv2.integral2(self.img, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        return self._integrals
+
+    def _match_fft(self, tpl):
+        H, W = self.img.shape[:2]
+        th, tw = tpl.shape[:2]
+
+        # Numerator: correlation of the image with the zero-mean template
+        # (the window mean drops out because the template sums to zero)
+        t = tpl.astype(np.float64)
+        t -= t.mean()
+        t_norm2 = float(np.dot(t.ravel(), t.ravel()))
+        if t_norm2 == 0:
+            # Constant template: TM_CCOEFF_NORMED reports a perfect match everywhere
+            return np.ones((H - th + 1, W - tw + 1), np.float32)
+        pad = np.zeros(self.dft_shape, np.float32)
+        pad[:th, :tw] = t
+        corr = cv2.mulSpectrums(self.spectrum, cv2.dft(pad), 0, conjB=True)
+        num = cv2.idft(corr, flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)[:H-th+1, :W-tw+1].astype(np.float64)
+
+        # Denominator: window variance from the integral images
+        s, sq = self.integrals
+        wsum = s[th:, tw:] - s[:-th, tw:] - s[th:, :-tw] + s[:-th, :-tw]
+        wsq = sq[th:, tw:] - sq[:-th, tw:] - sq[th:, :-tw] + sq[:-th, :-tw]
+        wvar = wsq - wsum * wsum / (th * tw)
+        np.maximum(wvar, 0, out=wvar)
+        denom = np.sqrt(wvar * t_norm2)
+
+        # Same clamping as OpenCV's normalisation for near-flat windows
+        res = np.zeros(num.shape, np.float32)
+        absnum = np.abs(num)
+        ok = absnum < denom
+        res[ok] = num[ok] / denom[ok]
+        near = ~ok & (absnum < denom * 1.125)
+        res[near] = np.sign(num[near])
+        return res
+
+def find_best_match(img_gray, tpl, scales=SCALES, angles=ANGLES, method=cv2.TM_CCOEFF_NORMED, offset=(0, 0), matcher=None):
+    """Search every (angle, scale) variant of tpl in img_gray.
+
+    Returns (best_score, best) where best is ((x, y), (w, h), scale, angle) or None.
+    `offset` is added to the location so ROI searches report full-image coordinates.
+    A SpectrumMatcher built on img_gray replaces cv2.matchTemplate (TM_CCOEFF_NORMED only).
+    """
+    best_score, best = -1.0, None
+    for ang in angles:
+        tpl_rot = rotate_keep_all(tpl, ang)
+        for s in scales:
+            tw = max(5, int(tpl_rot.shape[1]*s))
+            th = max(5, int(tpl_rot.shape[0]*s))
+
+            if tw >= img_gray.shape[1] or th >= img_gray.shape[0]:
+                continue
+
+            tpl_scaled = cv2.resize(tpl_rot, (tw, th), interpolation=cv2.INTER_AREA)
+            res = matcher.match(tpl_scaled) if matcher is not None else cv2.matchTemplate(img_gray, tpl_scaled, method)
+            _, max_val, _, max_loc = cv2.minMaxLoc(res)
+
+            if max_val > best_score:
+                best_score = max_val
+                best = ((max_loc[0] + offset[0], max_loc[1] + offset[1]), (tw, th), float(s), ang)
+    return best_score, best
@@ -0,0 +1,222 @@
+import secrets
+import threading
+import dataclasses
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .matching import find_best_match, SpectrumMatcher, SCALES, ANGLES
+
+# KCF/CSRT ship with opencv-contrib; plain opencv builds may expose them under cv2.legacy or not at all
+CV_TRACKERS = {'kcf': 'TrackerKCF_create', 'csrt': 'TrackerCSRT_create'}
+
+def create_cv_tracker(kind):
+    """Return a new OpenCV tracker of the given kind, or None if this OpenCV build lacks it."""
+    name = CV_TRACKERS.get(kind)
+    if name is None:
+        return None
+    for ns in (cv2, getattr(cv2, 'legacy', None)):
+        factory = getattr(ns, name, None) if ns is not None else None
+        if factory is not None:
+            return factory()
+    return None
+
+def cv_tracker_available(kind):
+    return create_cv_tracker(kind) is not None
+
+@dataclasses.dataclass
+class TrackState:
+    box: Tuple[int, int, int, int]
+    scale: float
+    angle: int
+    score: float
+    velocity: Tuple[float, float] = (0.0, 0.0)
+    cv_tracker: Optional[object] = None
+    frames_since_detect: int = 0
+
+class TemplateTracker:
+    """Per-template tracking across video frames.
+
+    Frames after a successful detection are searched only inside a motion-predicted
+    ROI around the last box, at the last angle and last scale +/- `scale_band`.
+    When the ROI score drops below threshold the template falls back to a full search.
+    Templates that are not in view are re-searched only every `redetect_interval` frames.
+    If `cv_tracker` is 'kcf' or 'csrt', that tracker carries the box between
+    re-detections, which also run every `redetect_interval` frames.
+
+    to_state() / load_state() move the tracks between processes through the client, since
+    gunicorn workers don't share memory. OpenCV trackers can't be serialised: a restored
+    track continues with ROI search and starts a new one on its next ROI match.
+    """
+
+    def __init__(self, templates, threshold=0.6, scale_band=0.1, num_band_scales=5,
+                 roi_margin=0.5, cv_tracker=None, redetect_interval=10):
+        self.templates = templates  # list of (name, grayscale template)
+        self.threshold = threshold
+        self.scale_band = scale_band
+        self.num_band_scales = num_band_scales
+        self.roi_margin = roi_margin
+        self.cv_tracker = cv_tracker
+        self.redetect_interval = redetect_interval
+        self.states = {}
+        self.next_search = {}  # frame index of the next full search for templates without a track
+        self.frame_idx = 0
+        self.rev = None  # changes every frame; tells a cached session from a newer client state
+
+    def update(self, img_bgr, img_gray):
+        """Process one frame. Returns (detections, stats)."""
+        detections = []
+        stats = {"variants": 0, "search_pixels": 0, "full_searches": 0, "skipped": 0}
+        matcher = None  # image spectrum, built on the first full search of this frame
+        for name, tpl in self.templates:
+            state = self.states.get(name)
+            mode = None
+            if state is not None:
+                mode = self._track(state, tpl, img_bgr, img_gray, stats)
+            elif self.frame_idx < self.next_search.get(name, 0):
+                # Absent on the last full search; wait for the next re-detection frame
+                stats["skipped"] += 1
+                continue
+            if mode is None:
+                matcher = matcher or SpectrumMatcher(img_gray)
+                state = self._detect(name, tpl, img_bgr, img_gray, stats, matcher)
+                mode = 'full'
+            if state is None:
+                continue
+            x, y, w, h = state.box
+            detections.append({
+                "name": name,
+                "score": float(state.score),
+                "box": [int(x), int(y), int(w), int(h)],
+                "scale": float(state.scale),
+                "angle": int(state.angle),
+                "mode": mode
+            })
+        self.frame_idx += 1
+        self.rev = secrets.token_hex(8)
+        return detections, stats
+
+    def to_state(self):
+        """JSON-safe tracks for the client to send back with the next frame."""
+        return {
+            "rev": self.rev,
+            "frame": self.frame_idx,
+            "tracks": {name: {"box": [int(v) for v in st.box], "scale": float(st.scale), "angle": int(st.angle),
+                              "score": float(st.score), "velocity": [float(v) for v in st.velocity]}
+                       for name, st in self.states.items()},
+            "next_search": {name: int(frame) for name, frame in self.next_search.items()},
+        }
+
+    def load_state(self, state):
+        """Restore to_state() output; raises ValueError if it is malformed."""
+        names = {name for name, _ in self.templates}
+        try:
+            self.frame_idx = int(state["frame"])
+            self.rev = state.get("rev")
+            self.states = {}
+            for name, track in state["tracks"].items():
+                if name in names:
+                    x, y, w, h = (int(v) for v in track["box"])
+                    vx, vy = (float(v) for v in track["velocity"])
+                    self.states[name] = TrackState(box=(x, y, w, h), scale=float(track["scale"]),
+                                                   angle=int(track["angle"]), score=float(track["score"]),
+                                                   velocity=(vx, vy))
+            self.next_search = {name: int(frame) for name, frame in state["next_search"].items() if name in names}
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise ValueError(f"Invalid tracking state: {e}")
+
+    def _detect(self, name, tpl, img_bgr, img_gray, stats, matcher):
+        stats["full_searches"] += 1
+        stats["variants"] += len(SCALES) * len(ANGLES)
+        stats["search_pixels"] += img_gray.shape[0] * img_gray.shape[1]
+        score, best = find_best_match(img_gray, tpl, SCALES, ANGLES, matcher=matcher)
+        if best is None or score < self.threshold:
+            self.states.pop(name, None)
+            self.next_search[name] = self.frame_idx + self.redetect_interval
+            return None
+        (x, y), (w, h), s, ang = best
+        state = TrackState(box=(x, y, w, h), scale=s, angle=ang, score=score)
+        self._init_cv_tracker(state, img_bgr)
+        self.states[name] = state
+        return state
+
+    def _track(self, state, tpl, img_bgr, img_gray, stats):
+        # Cheap path: let the OpenCV tracker carry the box between re-detections
+        if state.cv_tracker is not None and state.frames_since_detect < self.redetect_interval:
+            ok, box = state.cv_tracker.update(img_bgr)
+            if ok:
+                self._move(state, tuple(int(round(v)) for v in box))
+                state.frames_since_detect += 1
+                return 'cv_tracker'
+
+        # ROI search around the motion-predicted box, last angle, narrow scale band
+        H, W = img_gray.shape[:2]
+        x, y, w, h = state.box
+        vx, vy = state.velocity
+        px, py = x + vx, y + vy
+        mx = max(16, int(w * self.roi_margin))
+        my = max(16, int(h * self.roi_margin))
+        x0, y0 = int(max(0, px - mx)), int(max(0, py - my))
+        x1, y1 = int(min(W, px + w + mx)), int(min(H, py + h + my))
+        if x1 - x0 < 8 or y1 - y0 < 8:
+            return None
+
+        roi = img_gray[y0:y1, x0:x1]
+        scales = state.scale * (1.0 + np.linspace(-self.scale_band, self.scale_band, self.num_band_scales))
+        stats["variants"] += len(scales)
+        stats["search_pixels"] += roi.shape[0] * roi.shape[1]
+        score, best = find_best_match(roi, tpl, scales, [state.angle], offset=(x0, y0))
+        if best is None or score < self.threshold:
+            return None
+
+        (bx, by), (bw, bh), s, _ = best
+        self._move(state, (bx, by, bw, bh))
+        state.scale = s
+        state.score = score
+        self._init_cv_tracker(state, img_bgr)
+        return 'roi'
+
+    def _move(self, state, box):
+        x, y = state.box[:2]
+        state.velocity = (box[0] - x, box[1] - y)
+        state.box = box
+
+    def _init_cv_tracker(self, state, img_bgr):
+        state.frames_since_detect = 0
+        if not self.cv_tracker:
+            return
+        state.cv_tracker = create_cv_tracker(self.cv_tracker)
+        if state.cv_tracker is not None:
+            state.cv_tracker.init(img_bgr, tuple(int(v) for v in state.box))
+
+# Tracking sessions keyed by client-supplied session id (oldest evicted first). Per process:
+# a session survives here only while its frames keep reaching the same worker; otherwise it
+# is rebuilt from the state the client sends back.
+MAX_TRACK_SESSIONS = 16
+track_sessions = OrderedDict()
+track_sessions_lock = threading.Lock()
+
+def get_tracker(session_id, factory, reset=False, state=None):
+    """(tracker, source) for a session.
+
+    source is 'memory' when this process holds the session at the client's revision,
+    'client' when it was rebuilt from `state` (the last response's to_state()), 'new' otherwise.
+    """
+    with track_sessions_lock:
+        tracker = None if reset else track_sessions.get(session_id)
+        if tracker is not None and state is not None and state.get("rev") != tracker.rev:
+            tracker = None  # another worker handled the session since
+        source = 'memory'
+        if tracker is None:
+            tracker = factory()
+            source = 'new'
+            if state is not None and not reset:
+                tracker.load_state(state)
+                source = 'client'
+            track_sessions[session_id] = tracker
+        track_sessions.move_to_end(session_id)
+        while len(track_sessions) > MAX_TRACK_SESSIONS:
+            track_sessions.popitem(last=False)
+        return tracker, source
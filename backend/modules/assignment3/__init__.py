@@ -2,8 +2,12 @@ import os
 import cv2
 import numpy as np
 import base64
+import json
 from flask import Blueprint, jsonify, request
 from werkzeug.utils import secure_filename
+from .aruco import get_detector, estimate_poses
+from modules.common.resolution import request_budget, fit, points_to_original, area_to_original
+from .tiling import should_tile, tiled_gradient, tiled_log, tiled_canny, tiled_harris, DEFAULT_TILE_SIZE
 
 bp = Blueprint('assignment3', __name__, url_prefix='/api/assignment3')
 
@@ -35,35 +39,53 @@ def process():
         result_img = None
         info = {}
         
+        # Downscale once to the resolution budget (max_megapixels=0 keeps full resolution)
+        img, scale = fit(img, request_budget())
+        if scale < 1.0:
+            info['scale'] = scale
+        
+        # Large images run the filter tasks tile by tile with bounded memory
+        tiled = should_tile(img, params)
+        tile_size = int(params.get('tile_size', DEFAULT_TILE_SIZE))
+        
         if task == 'gradient':
             # Gradient Magnitude
             ksize = int(params.get('ksize', 3))
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            gray = cv2.GaussianBlur(gray, (3,3), 0)
-            dx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=ksize)
-            dy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=ksize)
-            mag = cv2.magnitude(dx, dy)
-            mag = cv2.normalize(mag, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
-            result_img = mag
+            if tiled:
+                result_img, info['tiles'] = tiled_gradient(img, ksize, tile_size)
+            else:
+                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                gray = cv2.GaussianBlur(gray, (3,3), 0)
+                dx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=ksize)
+                dy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=ksize)
+                mag = cv2.magnitude(dx, dy)
+                mag = cv2.normalize(mag, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+                result_img = mag
             
         elif task == 'log':
             # Laplacian of Gaussian
             ksize = int(params.get('ksize', 3))
             sigma = float(params.get('sigma', 1.0))
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            blur = cv2.GaussianBlur(gray, (0,0), sigma)
-            lap = cv2.Laplacian(blur, cv2.CV_32F, ksize=ksize)
-            lap = cv2.convertScaleAbs(lap)
-            result_img = lap
+            if tiled:
+                result_img, info['tiles'] = tiled_log(img, ksize, sigma, tile_size)
+            else:
+                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                blur = cv2.GaussianBlur(gray, (0,0), sigma)
+                lap = cv2.Laplacian(blur, cv2.CV_32F, ksize=ksize)
+                lap = cv2.convertScaleAbs(lap)
+                result_img = lap
             
         elif task == 'edges':
             # Canny Edge Detection
             low = int(params.get('low', 50))
             high = int(params.get('high', 150))
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            blur = cv2.GaussianBlur(gray, (3,3), 0)
-            edges = cv2.Canny(blur, low, high)
-            result_img = edges
+            if tiled:
+                result_img, info['tiles'] = tiled_canny(img, low, high, tile_size)
+            else:
+                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                blur = cv2.GaussianBlur(gray, (3,3), 0)
+                edges = cv2.Canny(blur, low, high)
+                result_img = edges
             
         elif task == 'corners':
             # Harris Corners
@@ -72,14 +94,17 @@ def process():
             k = float(params.get('k', 0.04))
             thresh = int(params.get('thresh', 100))
             
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            gray = np.float32(gray)
-            dst = cv2.cornerHarris(gray, block, ksize, k)
-            dst = cv2.dilate(dst, None)
+            if tiled:
+                result_img, info['tiles'] = tiled_harris(img, block, ksize, k, tile_size)
+            else:
+                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                gray = np.float32(gray)
+                dst = cv2.cornerHarris(gray, block, ksize, k)
+                dst = cv2.dilate(dst, None)
             
-            # Threshold for an optimal value, it may vary depending on the image.
-            result_img = img.copy()
-            result_img[dst > 0.01 * dst.max()] = [0, 0, 255]
+                # Threshold for an optimal value, it may vary depending on the image.
+                result_img = img.copy()
+                result_img[dst > 0.01 * dst.max()] = [0, 0, 255]
             
         elif task == 'boundary':
             # Boundary Detection
@@ -104,15 +129,16 @@ def process():
                 approx = cv2.approxPolyDP(cnt, epsilon, True)
                 cv2.drawContours(result_img, [approx], -1, (255, 0, 0), 2)
                 
-                info['area'] = cv2.contourArea(cnt)
+                info['area'] = area_to_original(cv2.contourArea(cnt), scale)
                 info['vertices'] = len(approx)
                 
         elif task == 'aruco':
             # ArUco Detection
+            try:
+                detector = get_detector(params.get('dictionary', 'DICT_4X4_50'))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
             gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
-            parameters = cv2.aruco.DetectorParameters()
-            detector = cv2.aruco.ArucoDetector(dictionary, parameters)
             corners, ids, rejected = detector.detectMarkers(gray)
             
             result_img = img.copy()
@@ -144,3 +170,67 @@ def process():
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+@bp.route('/aruco', methods=['POST'])
+def aruco_batch():
+    try:
+        files = request.files.getlist('images')
+        if not files:
+            return jsonify({"error": "No images uploaded"}), 400
+        
+        params = request.form
+        try:
+            detector = get_detector(params.get('dictionary', 'DICT_4X4_50'),
+                                    json.loads(params.get('detector_params', '{}')))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Optional pose estimation from a supplied camera matrix
+        camera_matrix = None
+        if params.get('camera_matrix'):
+            try:
+                camera_matrix = np.array(json.loads(params['camera_matrix']), dtype=np.float64).reshape(3, 3)
+                dist_coeffs = np.array(json.loads(params.get('dist_coeffs', '[0, 0, 0, 0, 0]')), dtype=np.float64)
+                marker_length = float(params.get('marker_length', 1.0))
+            except (ValueError, TypeError) as e:
+                return jsonify({"error": f"Invalid camera parameters: {e}"}), 400
+        return_images = params.get('return_images') == 'true'
+        budget = request_budget()
+        
+        results = []
+        for idx, file in enumerate(files):
+            # Decode in memory; calibration rigs send many frames in quick succession
+            img = cv2.imdecode(np.frombuffer(file.read(), np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                results.append({"index": idx, "filename": file.filename, "error": "Could not read image"})
+                continue
+            
+            # Detect at the resolution budget, then report corners and poses in original-image space
+            small, scale = fit(img, budget)
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+            corners, ids, _ = detector.detectMarkers(gray)
+            corners = [points_to_original(c, scale).astype(np.float32) for c in corners]
+            
+            entry = {
+                "index": idx,
+                "filename": file.filename,
+                "ids": ids.ravel().tolist() if ids is not None else [],
+                "corners": [c.reshape(4, 2).tolist() for c in corners]
+            }
+            if camera_matrix is not None and ids is not None:
+                entry["poses"] = estimate_poses(corners, camera_matrix, dist_coeffs, marker_length)
+            if return_images:
+                vis = img.copy()
+                if ids is not None:
+                    cv2.aruco.drawDetectedMarkers(vis, corners, ids)
+                    if camera_matrix is not None:
+                        for pose in entry["poses"]:
+                            cv2.drawFrameAxes(vis, camera_matrix, dist_coeffs, np.array(pose["rvec"]),
+                                              np.array(pose["tvec"]), marker_length * 0.5)
+                entry["image"] = encode_image(vis)
+            results.append(entry)
+        
+        return jsonify({"results": results})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,72 @@
+import threading
+
+import cv2
+import numpy as np
+
+# Detectors keyed by (dictionary name, sorted parameter overrides); built once, reused across requests
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+def check_params(params):
+    """Validate DetectorParameters overrides: known names, values of the parameter's own type.
+
+    Raises ValueError on bad input, so routes can answer 400.
+    """
+    if params is None:
+        return {}
+    if not isinstance(params, dict):
+        raise ValueError("detector_params must be a JSON object")
+    defaults = cv2.aruco.DetectorParameters()
+    checked = {}
+    for name, value in params.items():
+        if name.startswith('_') or not hasattr(defaults, name):
+            raise ValueError(f"Unknown detector parameter: {name}")
+        current = getattr(defaults, name)
+        if isinstance(current, bool):
+            ok = isinstance(value, bool)
+        elif isinstance(current, int):
+            ok = isinstance(value, int) and not isinstance(value, bool)
+        elif isinstance(current, float):
+            ok = isinstance(value, (int, float)) and not isinstance(value, bool)
+            value = float(value) if ok else value
+        else:
+            ok = False
+        if not ok:
+            raise ValueError(f"Detector parameter {name} expects a {type(current).__name__}")
+        checked[name] = value
+    return checked
+
+def get_detector(dictionary='DICT_4X4_50', params=None):
+    """Return a cached cv2.aruco.ArucoDetector for a predefined dictionary and DetectorParameters overrides."""
+    params = check_params(params)
+    if not isinstance(dictionary, str) or not dictionary.startswith('DICT_') or not hasattr(cv2.aruco, dictionary):
+        raise ValueError(f"Unknown ArUco dictionary: {dictionary}")
+    key = (dictionary, tuple(sorted(params.items())))
+    with _detectors_lock:
+        detector = _detectors.get(key)
+        if detector is None:
+            parameters = cv2.aruco.DetectorParameters()
+            for name, value in params.items():
+                setattr(parameters, name, value)
+            dict_id = getattr(cv2.aruco, dictionary)
+            detector = cv2.aruco.ArucoDetector(cv2.aruco.getPredefinedDictionary(dict_id), parameters)
+            _detectors[key] = detector
+    return detector
+
+def marker_object_points(marker_length):
+    # Corner order matches detectMarkers (top-left, top-right, bottom-right, bottom-left), as SOLVEPNP_IPPE_SQUARE expects
+    half = marker_length / 2.0
+    return np.array([[-half, half, 0], [half, half, 0], [half, -half, 0], [-half, -half, 0]], dtype=np.float32)
+
+def estimate_poses(corners, camera_matrix, dist_coeffs, marker_length):
+    """Per-marker pose (rvec, tvec) in the camera frame, in the units of marker_length."""
+    obj = marker_object_points(marker_length)
+    poses = []
+    for c in corners:
+        ok, rvec, tvec = cv2.solvePnP(obj, c.reshape(4, 2), camera_matrix, dist_coeffs, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+        poses.append({
+            "success": bool(ok),
+            "rvec": rvec.ravel().tolist(),
+            "tvec": tvec.ravel().tolist()
+        })
+    return poses
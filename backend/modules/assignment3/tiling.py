@@ -0,0 +1,176 @@
+import os
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from modules.common.threads import cv_threads
+
+# Images at or above this size are processed tile by tile unless the request opts out
+TILE_MIN_PIXELS = 4_000_000
+DEFAULT_TILE_SIZE = 1024
+
+# core: tile region in image coordinates; padded: core plus halo, clipped to the image;
+# inner: the core region expressed in padded-tile coordinates
+Tile = collections.namedtuple('Tile', ['core', 'padded', 'inner'])
+
+def make_tiles(shape, tile_size, halo):
+    h, w = shape[:2]
+    tiles = []
+    for y0 in range(0, h, tile_size):
+        for x0 in range(0, w, tile_size):
+            y1, x1 = min(h, y0 + tile_size), min(w, x0 + tile_size)
+            py0, px0 = max(0, y0 - halo), max(0, x0 - halo)
+            py1, px1 = min(h, y1 + halo), min(w, x1 + halo)
+            tiles.append(Tile(
+                core=(slice(y0, y1), slice(x0, x1)),
+                padded=(slice(py0, py1), slice(px0, px1)),
+                inner=(slice(y0 - py0, y1 - py0), slice(x0 - px0, x1 - px0))
+            ))
+    return tiles
+
+# One tile pool per process, sized to its CPU share: concurrent tiled requests queue their
+# tiles on it instead of each starting a pool of their own
+_pool = None
+_pool_lock = threading.Lock()
+
+def _reset_pool():
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_pool)
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=cv_threads(), thread_name_prefix='tiles')
+        return _pool
+
+def map_tiles(fn, tiles, workers=None):
+    """Run fn(tile) for every tile on the tile pool (OpenCV releases the GIL) and return results in tile order.
+
+    workers=1 runs serially; any other explicit value gets a private pool of that size.
+    """
+    workers = workers or cv_threads()
+    if workers == 1 or len(tiles) == 1:
+        return [fn(t) for t in tiles]
+    if workers == cv_threads():
+        return list(get_pool().map(fn, tiles))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, tiles))
+
+def should_tile(img, params):
+    tiled = params.get('tiled', 'auto')
+    if tiled == 'auto':
+        return img.shape[0] * img.shape[1] >= TILE_MIN_PIXELS
+    return tiled == 'true'
+
+# Halo sizes: each filter in a chain widens the footprint by its kernel radius.
+# Within that distance of a tile edge the padded tile sees the same neighbourhood as the
+# full image, and at true image borders OpenCV's own border handling applies, so stitched
+# cores match the whole-image result exactly.
+
+def sobel_radius(ksize):
+    return max(1, ksize // 2)
+
+def gaussian_radius(sigma):
+    # OpenCV picks ksize ~ 6*sigma+1 for 8-bit input, 8*sigma+1 otherwise
+    return int(np.ceil(4 * sigma)) + 1
+
+# --- Tasks ---
+
+def tiled_gradient(img, ksize=3, tile_size=DEFAULT_TILE_SIZE, workers=None):
+    tiles = make_tiles(img.shape, tile_size, 1 + sobel_radius(ksize))
+
+    def magnitude(t):
+        gray = cv2.cvtColor(img[t.padded], cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (3,3), 0)
+        dx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=ksize)
+        dy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=ksize)
+        return cv2.magnitude(dx, dy)[t.inner]
+
+    # Pass 1: global min/max for NORM_MINMAX without holding the full float magnitude
+    extrema = map_tiles(lambda t: cv2.minMaxLoc(magnitude(t))[:2], tiles, workers)
+    lo = min(e[0] for e in extrema)
+    hi = max(e[1] for e in extrema)
+    scale = 255.0 / (hi - lo) if hi > lo else 0.0
+
+    # Pass 2: recompute each tile and write its normalised core
+    out = np.empty(img.shape[:2], np.uint8)
+    def write(t):
+        mag = magnitude(t)
+        mag -= lo
+        mag *= scale
+        out[t.core] = mag.astype(np.uint8)
+    map_tiles(write, tiles, workers)
+    return out, len(tiles)
+
+def tiled_log(img, ksize=3, sigma=1.0, tile_size=DEFAULT_TILE_SIZE, workers=None):
+    tiles = make_tiles(img.shape, tile_size, gaussian_radius(sigma) + sobel_radius(ksize))
+    out = np.empty(img.shape[:2], np.uint8)
+
+    def write(t):
+        gray = cv2.cvtColor(img[t.padded], cv2.COLOR_BGR2GRAY)
+        blur = cv2.GaussianBlur(gray, (0,0), sigma)
+        lap = cv2.Laplacian(blur, cv2.CV_32F, ksize=ksize)
+        out[t.core] = cv2.convertScaleAbs(lap)[t.inner]
+    map_tiles(write, tiles, workers)
+    return out, len(tiles)
+
+def _reconstruct(marker, mask):
+    # Keep the 8-connected components of mask that contain a marker pixel
+    n, labels = cv2.connectedComponents(mask, connectivity=8)
+    keep = np.zeros(n, bool)
+    keep[np.unique(labels[marker > 0])] = True
+    keep[0] = False
+    return keep[labels].astype(np.uint8) * 255
+
+def tiled_canny(img, low=50, high=150, tile_size=DEFAULT_TILE_SIZE, workers=None):
+    low, high = min(low, high), max(low, high)
+    # 3x3 blur + 3x3 Sobel + non-maximum suppression neighbourhood
+    tiles = make_tiles(img.shape, tile_size, 4)
+    out = np.empty(img.shape[:2], np.uint8)
+    weak = np.empty(img.shape[:2], np.uint8)
+
+    # Pass 1: per-tile non-maximum suppression at both thresholds
+    def suppress(t):
+        gray = cv2.cvtColor(img[t.padded], cv2.COLOR_BGR2GRAY)
+        blur = cv2.GaussianBlur(gray, (3,3), 0)
+        out[t.core] = cv2.Canny(blur, high, high)[t.inner]
+        weak[t.core] = cv2.Canny(blur, low, low)[t.inner]
+    map_tiles(suppress, tiles, workers)
+
+    # Pass 2: hysteresis is connectivity-global, so grow strong edges through weak ones
+    # tile by tile (each padded tile sees its neighbours' current edges) until nothing changes
+    def grow(t):
+        grown = _reconstruct(out[t.padded], weak[t.padded])[t.inner]
+        if np.array_equal(grown, out[t.core]):
+            return False
+        out[t.core] = grown
+        return True
+    while any(map_tiles(grow, tiles, workers)):
+        pass
+    return out, len(tiles)
+
+def tiled_harris(img, block=2, ksize=3, k=0.04, tile_size=DEFAULT_TILE_SIZE, workers=None):
+    # Sobel aperture + blockSize window + 3x3 dilation
+    tiles = make_tiles(img.shape, tile_size, sobel_radius(ksize) + block + 1)
+
+    def response(t):
+        gray = np.float32(cv2.cvtColor(img[t.padded], cv2.COLOR_BGR2GRAY))
+        return cv2.cornerHarris(gray, block, ksize, k)
+
+    # Pass 1: global maximum (dilation does not change it, so it is skipped here)
+    thresh = 0.01 * max(map_tiles(lambda t: float(response(t)[t.inner].max()), tiles, workers))
+
+    # Pass 2: dilate, threshold and paint each core into the output copy
+    result = img.copy()
+    def write(t):
+        dst = cv2.dilate(response(t), None)[t.inner]
+        result[t.core][dst > thresh] = [0, 0, 255]
+    map_tiles(write, tiles, workers)
+    return result, len(tiles)
@@ -8,6 +8,9 @@ import dataclasses
 from typing import List, Tuple, Sequence
 from flask import Blueprint, jsonify, request
 from werkzeug.utils import secure_filename
+from .index import get_index
+from .parallel import detect_and_compute_many
+from modules.common.resolution import request_budget, fit
 
 bp = Blueprint('assignment4', __name__, url_prefix='/api/assignment4')
 
@@ -31,13 +34,14 @@ def stitch_images():
             return jsonify({"error": "Need at least 2 images"}), 400
             
         images = []
+        budget = request_budget()
         for file in files:
             filename = secure_filename(file.filename)
             filepath = os.path.join(UPLOAD_FOLDER, filename)
             file.save(filepath)
             img = cv2.imread(filepath)
             if img is not None:
-                images.append(img)
+                images.append(fit(img, budget)[0])
         
         if len(images) < 2:
             return jsonify({"error": "Could not read images"}), 400
@@ -257,18 +261,18 @@ def sift_demo():
         img_a = cv2.imread(path_a)
         img_b = cv2.imread(path_b)
         
-        # Resize for speed
-        max_w = 480
-        if img_a.shape[1] > max_w: img_a = cv2.resize(img_a, (max_w, int(img_a.shape[0]*max_w/img_a.shape[1])))
-        if img_b.shape[1] > max_w: img_b = cv2.resize(img_b, (max_w, int(img_b.shape[0]*max_w/img_b.shape[1])))
+        # Work at the endpoint's resolution budget
+        budget = request_budget()
+        img_a, _ = fit(img_a, budget)
+        img_b, _ = fit(img_b, budget)
         
         gray_a = cv2.cvtColor(img_a, cv2.COLOR_BGR2GRAY).astype(np.float32) / 255.0
         gray_b = cv2.cvtColor(img_b, cv2.COLOR_BGR2GRAY).astype(np.float32) / 255.0
         
-        # Custom SIFT
+        # Custom SIFT: both images' octaves run in parallel on the process pool
         sift = SIFTFromScratch()
-        kp_a, desc_a = sift.detect_and_compute(gray_a)
-        kp_b, desc_b = sift.detect_and_compute(gray_b)
+        compare_serial = request.form.get('compare_serial') == 'true'
+        ((kp_a, desc_a), (kp_b, desc_b)), parallel_stats = detect_and_compute_many(sift, [gray_a, gray_b], compare_serial)
         matches = match_descriptors(desc_a, desc_b)
         vis_custom = draw_matches_vis(img_a, img_b, kp_a, kp_b, matches[:50]) # Show top 50
         
@@ -318,9 +322,83 @@ def sift_demo():
             "opencv": encode_image(vis_cv),
             "stats": {
                 "custom_matches": len(matches),
-                "opencv_matches": len(good_cv)
+                "opencv_matches": len(good_cv),
+                "parallel": parallel_stats
             }
         })
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+# --- Descriptor Index / Retrieval ---
+
+def read_gray(file):
+    return cv2.imdecode(np.frombuffer(file.read(), np.uint8), cv2.IMREAD_GRAYSCALE)
+
+@bp.route('/index/ingest', methods=['POST'])
+def index_ingest():
+    try:
+        files = request.files.getlist('images')
+        if not files:
+            return jsonify({"error": "No images uploaded"}), 400
+        
+        index = get_index()
+        budget = request_budget('assignment4.index')
+        added, skipped = [], []
+        for file in files:
+            img = read_gray(file)
+            if img is None:
+                skipped.append(file.filename)
+                continue
+            entry = index.add(secure_filename(file.filename), img, budget)
+            added.append({"id": entry["id"], "name": entry["name"], "descriptors": entry["count"]})
+        
+        stats = index.refresh() if added else None
+        return jsonify({"added": added, "skipped": skipped, "index": stats})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/index/build', methods=['POST'])
+def index_build():
+    try:
+        branching = request.form.get('branching')
+        return jsonify(get_index().build(int(branching) if branching else None))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/index/query', methods=['POST'])
+def index_query():
+    try:
+        if 'image' not in request.files:
+            return jsonify({"error": "No image uploaded"}), 400
+        img = read_gray(request.files['image'])
+        if img is None:
+            return jsonify({"error": "Could not read image"}), 400
+        
+        top_k = int(request.form.get('top_k', 5))
+        shortlist = int(request.form.get('shortlist', 20))
+        try:
+            results = get_index().query(img, top_k=top_k, shortlist=max(top_k, shortlist),
+                                        megapixels=request_budget('assignment4.index'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"results": results})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/index/stats', methods=['GET'])
+def index_stats():
+    index = get_index()
+    index.sync()
+    return jsonify({
+        "images": len(index.images),
+        "descriptors": index.num_descriptors,
+        "vocab_size": index.vocab_size,
+        "trained_on": index.trained_on,
+        "stale": index.stale,
+        "built": index.ivf is not None
+    })
@@ -0,0 +1,356 @@
+import os
+import json
+import threading
+import contextlib
+
+import cv2
+import numpy as np
+
+from modules.common.resolution import BUDGETS, fit, points_to_original
+
+try:
+    import fcntl
+except ImportError:  # Windows dev setups: locking is per process only
+    fcntl = None
+
+INDEX_FOLDER = os.environ.get('CV_SIFT_INDEX_DIR', 'sift_index')
+MAX_FEATURES = 1000      # SIFT keypoints kept per image
+# Two-level vocabulary: k-means into VOCAB_BRANCHING coarse cells, then each cell into up to
+# VOCAB_BRANCHING words, i.e. up to 16384 words by default. With ~1000 features per image a
+# flat vocabulary of ~1000 words puts nearly every word in nearly every image, so postings
+# grow with the library; this many words keeps them short and assignment costs 2 x branching
+# distance computations per descriptor instead of branching^2.
+VOCAB_BRANCHING = int(os.environ.get('CV_VOCAB_BRANCHING', 128))
+MIN_WORD_SAMPLES = 10    # sampled descriptors per word, at least
+VOCAB_SAMPLE = 200_000   # descriptors sampled for k-means
+VOCAB_KEYS = ('coarse', 'fine', 'fine_sizes')
+# refresh() retrains once the library holds this many times the descriptors the vocabulary
+# was trained on; a vocabulary fitted to the first few images gives every later image the
+# same words. Doubling keeps the retraining cost amortised linear in the library size.
+RETRAIN_GROWTH = float(os.environ.get('CV_VOCAB_RETRAIN_GROWTH', 2.0))
+ASSIGN_CHUNK = 50_000    # descriptors per nearest-word batch
+
+def extract(img_gray, megapixels=BUDGETS['assignment4.index']):
+    """OpenCV SIFT keypoints (xy, float32) and descriptors (uint8) at a resolution budget.
+
+    OpenCV SIFT descriptors are already integers in [0, 255], so the uint8 storage is lossless.
+    Keypoints are stored in original-image coordinates.
+    """
+    small, scale = fit(img_gray, megapixels)
+    kps, desc = cv2.SIFT_create(nfeatures=MAX_FEATURES).detectAndCompute(small, None)
+    if desc is None:
+        return np.zeros((0, 2), np.float32), np.zeros((0, 128), np.uint8)
+    xy = points_to_original([kp.pt for kp in kps], scale).astype(np.float32)
+    return xy, np.clip(np.rint(desc), 0, 255).astype(np.uint8)
+
+def _kmeans(data, k):
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
+    _, labels, centers = cv2.kmeans(data, k, None, criteria, 1, cv2.KMEANS_PP_CENTERS)
+    return centers, labels.ravel()
+
+def _nearest(desc, centers):
+    matches = cv2.BFMatcher(cv2.NORM_L2).match(desc, centers)
+    nearest = np.zeros(len(desc), np.int64)
+    nearest[[m.queryIdx for m in matches]] = [m.trainIdx for m in matches]
+    return nearest
+
+def train_vocabulary(sample, branching):
+    """Two-level k-means. Word id = coarse cell * branching + word within the cell."""
+    n_coarse = min(branching, max(1, len(sample) // MIN_WORD_SAMPLES))
+    coarse, labels = _kmeans(sample, n_coarse) if n_coarse > 1 else (sample.mean(axis=0, keepdims=True), np.zeros(len(sample), np.int64))
+    fine = np.zeros((n_coarse, branching, 128), np.float32)
+    sizes = np.ones(n_coarse, np.int32)
+    for c in range(n_coarse):
+        members = sample[labels == c]
+        k = min(branching, len(members) // MIN_WORD_SAMPLES)
+        if k > 1:
+            fine[c, :k] = _kmeans(members, k)[0]
+            sizes[c] = k
+        else:
+            # Too few samples to split: the cell is a single word
+            fine[c, 0] = members.mean(axis=0) if len(members) else coarse[c]
+    return {"coarse": coarse.astype(np.float32), "fine": fine, "fine_sizes": sizes}
+
+class DescriptorIndex:
+    """On-disk SIFT library with a bag-of-visual-words inverted file.
+
+    Layout under `root`:
+      descriptors.u8  N x 128 uint8, append-only, memory-mapped for reads
+      keypoints.f32   N x 2 keypoint coordinates, parallel to descriptors
+      words.u32       N visual-word ids, parallel to descriptors
+      images.json     per-image name, descriptor offset/count and size
+      ivf.npz         two-level vocabulary (coarse and per-cell k-means centroids, and the
+                      descriptor count it was trained on) and inverted file (CSR by word: image ids, term counts), idf, image norms
+      index.lock      flock target serialising writers across processes
+
+    Several gunicorn workers share one root. Writers hold the flock and re-read the
+    metadata first; images.json and ivf.npz are replaced atomically, and every instance
+    reloads them when their mtime changes, so readers see other workers' ingests and builds.
+    """
+
+    def __init__(self, root=INDEX_FOLDER):
+        self.root = root
+        self.lock = threading.Lock()
+        self.images = []
+        self.vocab = None
+        self.trained_on = 0
+        self.ivf = None
+        self._stamps = {}
+        self._sync()
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _stamp(self, name):
+        try:
+            st = os.stat(self._path(name))
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _sync(self):
+        """Reload images.json and ivf.npz if another process replaced them."""
+        stamp = self._stamp('images.json')
+        if stamp != self._stamps.get('images.json'):
+            self._stamps['images.json'] = stamp
+            self.images = []
+            if stamp is not None:
+                with open(self._path('images.json')) as f:
+                    self.images = json.load(f)
+        stamp = self._stamp('ivf.npz')
+        if stamp != self._stamps.get('ivf.npz'):
+            self._stamps['ivf.npz'] = stamp
+            self.vocab = self.ivf = None
+            self.trained_on = 0
+            if stamp is not None:
+                ivf = dict(np.load(self._path('ivf.npz')))
+                if all(key in ivf for key in VOCAB_KEYS):
+                    self.vocab = {key: ivf.pop(key) for key in VOCAB_KEYS}
+                    # Absent in indexes written before it was recorded: treated as stale
+                    self.trained_on = int(ivf.pop('trained_on', 0))
+                    self.ivf = ivf
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        """Exclusive write access across threads and worker processes, on fresh metadata."""
+        with self.lock:
+            os.makedirs(self.root, exist_ok=True)
+            with open(self._path('index.lock'), 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._sync()
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _replace(self, name, write):
+        """Write a file next to its final name, then swap it in atomically."""
+        tmp = self._path(f'{name}.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            write(f)
+        os.replace(tmp, self._path(name))
+        self._stamps[name] = self._stamp(name)
+
+    def _array(self, name, dtype, cols=None):
+        path = self._path(name)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.zeros((0, cols) if cols else (0,), dtype)
+        arr = np.memmap(path, dtype=dtype, mode='r')
+        return arr.reshape(-1, cols) if cols else arr
+
+    @property
+    def num_descriptors(self):
+        return self.images[-1]["offset"] + self.images[-1]["count"] if self.images else 0
+
+    def descriptors(self):
+        return self._array('descriptors.u8', np.uint8, 128)
+
+    def keypoints(self):
+        return self._array('keypoints.f32', np.float32, 2)
+
+    def words(self):
+        return self._array('words.u32', np.uint32)
+
+    # --- Ingest / build ---
+
+    def add(self, name, img_gray, megapixels=BUDGETS['assignment4.index']):
+        xy, desc = extract(img_gray, megapixels)
+        with self._exclusive():
+            # The descriptor file, not this process's view of images.json, says where the data ends
+            path = self._path('descriptors.u8')
+            offset = os.path.getsize(path) // 128 if os.path.exists(path) else 0
+            entry = {"id": len(self.images), "name": name, "offset": offset,
+                     "count": len(desc), "width": int(img_gray.shape[1]), "height": int(img_gray.shape[0])}
+            self._write_rows('descriptors.u8', offset * 128, desc.tobytes())
+            self._write_rows('keypoints.f32', offset * 8, xy.tobytes())
+            if self.vocab is not None:
+                self._write_rows('words.u32', offset * 4, self.assign(desc).tobytes())
+            self.images.append(entry)
+            self._save_images()
+        return entry
+
+    def _write_rows(self, name, pos, data):
+        # Positional writes keep the parallel files aligned even if a crashed writer left rows behind
+        path = self._path(name)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            f.seek(pos)
+            f.write(data)
+
+    @property
+    def vocab_size(self):
+        return int(self.vocab["fine_sizes"].sum()) if self.vocab is not None else 0
+
+    @property
+    def stale(self):
+        """True when the library has outgrown the vocabulary (see RETRAIN_GROWTH)."""
+        return self.vocab is not None and self.num_descriptors >= RETRAIN_GROWTH * max(self.trained_on, 1)
+
+    def _stats(self, retrained):
+        return {"vocab_size": self.vocab_size, "descriptors": self.num_descriptors, "images": len(self.images),
+                "trained_on": self.trained_on, "retrained": retrained}
+
+    def build(self, branching=None):
+        """(Re)train the vocabulary on a descriptor sample, reassign every descriptor, rebuild the inverted file."""
+        with self._exclusive():
+            return self._build(branching)
+
+    def _build(self, branching=None):
+        desc = self.descriptors()
+        if len(desc) == 0:
+            raise ValueError("Index is empty")
+        rng = np.random.default_rng(0)
+        sample = desc[np.sort(rng.choice(len(desc), min(len(desc), VOCAB_SAMPLE), replace=False))]
+        self.vocab = train_vocabulary(sample.astype(np.float32), max(2, branching or VOCAB_BRANCHING))
+        self.trained_on = int(len(desc))
+        with open(self._path('words.u32'), 'wb') as f:
+            for start in range(0, len(desc), ASSIGN_CHUNK):
+                f.write(self.assign(desc[start:start + ASSIGN_CHUNK]).tobytes())
+        self._build_ivf()
+        return self._stats(retrained=True)
+
+    def refresh(self):
+        """Bring the inverted file up to date after add().
+
+        Trains a vocabulary on first use and retrains it, at the same branching, once the
+        library has outgrown it.
+        """
+        with self._exclusive():
+            if self.vocab is None:
+                return self._build()
+            if self.stale:
+                return self._build(self.vocab["fine"].shape[1])
+            self._build_ivf()
+            return self._stats(retrained=False)
+
+    def assign(self, desc):
+        """Visual word per descriptor: nearest coarse cell, then nearest word within it."""
+        if len(desc) == 0:
+            return np.zeros(0, np.uint32)
+        desc = np.asarray(desc, np.float32)
+        fine, sizes = self.vocab["fine"], self.vocab["fine_sizes"]
+        cells = _nearest(desc, self.vocab["coarse"])
+        words = np.zeros(len(desc), np.uint32)
+        for c in np.unique(cells):
+            rows = np.flatnonzero(cells == c)
+            words[rows] = c * fine.shape[1] + _nearest(desc[rows], fine[c, :sizes[c]])
+        return words
+
+    def _owners(self, n):
+        """Image id per descriptor row; -1 for rows no image owns (left by an interrupted add)."""
+        owners = np.full(n, -1, np.int64)
+        for img in self.images:
+            owners[img["offset"]:img["offset"] + img["count"]] = img["id"]
+        return owners
+
+    def _build_ivf(self):
+        k = self.vocab["fine"].shape[0] * self.vocab["fine"].shape[1]  # word id space
+        n_images = len(self.images)
+        words = np.asarray(self.words(), np.int64)
+        owners = self._owners(len(words))
+        keep = owners >= 0
+        pairs, counts = np.unique(words[keep] * n_images + owners[keep], return_counts=True)
+        word_of, image_of = pairs // n_images, pairs % n_images
+        indptr = np.zeros(k + 1, np.int64)
+        np.cumsum(np.bincount(word_of, minlength=k), out=indptr[1:])
+        df = np.diff(indptr)
+        idf = np.log((n_images + 1) / (df + 1)).astype(np.float32)
+        weights = counts * idf[word_of]
+        norms = np.sqrt(np.bincount(image_of, weights=weights * weights, minlength=n_images)).astype(np.float32)
+        self.ivf = {"indptr": indptr, "images": image_of.astype(np.int32),
+                    "counts": counts.astype(np.float32), "idf": idf, "norms": norms}
+        self._replace('ivf.npz', lambda f: np.savez(f, **self.vocab, **self.ivf, trained_on=self.trained_on))
+
+    def _save_images(self):
+        self._replace('images.json', lambda f: f.write(json.dumps(self.images).encode('utf-8')))
+
+    # --- Query ---
+
+    def vote(self, words):
+        """tf-idf cosine scores over the inverted file; touches only postings of the query's words."""
+        ivf = self.ivf
+        q_words, q_counts = np.unique(words, return_counts=True)
+        q_weights = q_counts * ivf["idf"][q_words]
+        scores = np.zeros(len(ivf["norms"]), np.float32)
+        for w, qw in zip(q_words, q_weights):
+            lo, hi = ivf["indptr"][w], ivf["indptr"][w + 1]
+            scores[ivf["images"][lo:hi]] += qw * ivf["counts"][lo:hi] * ivf["idf"][w]
+        norm = np.sqrt(np.sum(q_weights * q_weights)) * ivf["norms"]
+        return np.divide(scores, norm, out=np.zeros_like(scores), where=norm > 0)
+
+    def verify(self, q_xy, q_desc, image_id, ratio=0.75):
+        """RANSAC homography inliers between the query and one library image."""
+        entry = self.images[image_id]
+        lo, hi = entry["offset"], entry["offset"] + entry["count"]
+        if hi - lo < 2 or len(q_desc) < 2:
+            return 0
+        db_desc = np.asarray(self.descriptors()[lo:hi], np.float32)
+        db_xy = np.asarray(self.keypoints()[lo:hi])
+        knn = cv2.BFMatcher(cv2.NORM_L2).knnMatch(np.asarray(q_desc, np.float32), db_desc, k=2)
+        good = [m for m, n in (p for p in knn if len(p) == 2) if m.distance < ratio * n.distance]
+        if len(good) < 4:
+            return 0
+        src = q_xy[[m.queryIdx for m in good]].reshape(-1, 1, 2)
+        dst = db_xy[[m.trainIdx for m in good]].reshape(-1, 1, 2)
+        _, mask = cv2.findHomography(src, dst, cv2.RANSAC, 5.0)
+        return int(mask.sum()) if mask is not None else 0
+
+    def query(self, img_gray, top_k=5, shortlist=20, megapixels=BUDGETS['assignment4.index']):
+        self.sync()
+        if self.ivf is None or not self.images:
+            raise ValueError("Index has not been built")
+        q_xy, q_desc = extract(img_gray, megapixels)
+        if len(q_desc) == 0:
+            return []
+        scores = self.vote(self.assign(q_desc))
+        # Partial selection of the shortlist; only those few are sorted
+        shortlist = min(shortlist, len(scores))
+        candidates = np.argpartition(-scores, shortlist - 1)[:shortlist]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        results = []
+        for image_id in candidates:
+            if scores[image_id] <= 0:
+                break
+            results.append({
+                "id": int(image_id),
+                "name": self.images[image_id]["name"],
+                "score": float(scores[image_id]),
+                "inliers": self.verify(q_xy, q_desc, int(image_id))
+            })
+        results.sort(key=lambda r: (r["inliers"], r["score"]), reverse=True)
+        return results[:top_k]
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DescriptorIndex()
+        return _index
@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from modules.common.threads import cv_threads
+
+# Pool size per server process: its CPU share (CV_NUM_THREADS under gunicorn), at most 4
+SIFT_WORKERS = int(os.environ.get('CV_SIFT_WORKERS') or min(cv_threads(), 4))
+
+def _share(layers):
+    """Copy a list of equally sized float32 layers into one shared-memory block."""
+    shape = (len(layers),) + layers[0].shape
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 4)
+    stack = np.ndarray(shape, np.float32, buffer=shm.buf)
+    for i, layer in enumerate(layers):
+        stack[i] = layer
+    del stack
+    return shm, (shm.name, shape)
+
+def _attach(name, shape):
+    # Spawned workers share the parent's resource tracker, which already tracks the block
+    # and cleans it up if the parent dies; 3.13+ can skip registering it again
+    kwargs = {'track': False} if sys.version_info >= (3, 13) else {}
+    shm = shared_memory.SharedMemory(name=name, **kwargs)
+    return shm, np.ndarray(shape, np.float32, buffer=shm.buf)
+
+def _octave_work(params, octave_idx, gauss, dog):
+    from modules.assignment4 import SIFTFromScratch
+    sift = SIFTFromScratch(**params)
+    # Placeholders for the other octaves keep kp.octave indexing identical to the serial path
+    gaussian_pyramid = [None] * octave_idx + [list(gauss)]
+    dog_pyramid = [[]] * octave_idx + [list(dog)]
+    keypoints = sift._find_scale_space_extrema(gaussian_pyramid, dog_pyramid)
+    oriented = sift._assign_orientations(keypoints, gaussian_pyramid)
+    return oriented, sift._compute_descriptors(oriented, gaussian_pyramid)
+
+def _octave_task(params, octave_idx, gauss_spec, dog_spec):
+    """Extrema, orientations and descriptors for one octave, reading the pyramid from shared memory."""
+    start = time.perf_counter()
+    g_shm, gauss = _attach(*gauss_spec)
+    d_shm, dog = _attach(*dog_spec)
+    try:
+        keypoints, descriptors = _octave_work(params, octave_idx, gauss, dog)
+    finally:
+        # Views into the blocks must be gone before they can be closed
+        del gauss, dog
+        g_shm.close()
+        d_shm.close()
+    return keypoints, descriptors, time.perf_counter() - start
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _reset_pool():
+    # A pool created before fork (e.g. by warm-up in the gunicorn master) is unusable in the child
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_pool)
+
+def get_pool():
+    # Spawned (not forked) workers: the server process is multi-threaded
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=SIFT_WORKERS, mp_context=mp.get_context('spawn'))
+        return _pool
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+def sift_params(sift):
+    return {"num_octaves": sift.num_octaves, "num_scales": sift.num_scales, "sigma": sift.sigma,
+            "contrast_threshold": sift.contrast_threshold, "edge_threshold": sift.edge_threshold}
+
+def detect_and_compute_many(sift, images, compare_serial=False):
+    """SIFTFromScratch.detect_and_compute for several images, one pool task per (image, octave).
+
+    Pyramids are built in this process (OpenCV, GIL-free) and handed to workers through
+    shared memory. Results are merged in (image, octave) order, so keypoints and descriptors
+    come out exactly as the serial path produces them.
+    Returns (list of (keypoints, descriptors), stats). Stats are measured wall times;
+    worker_task_s is the sum of the tasks' own run times, which grows under CPU contention,
+    so it is not a serial-time estimate. compare_serial adds a measured serial run and speedup.
+    """
+    start = time.perf_counter()
+    if SIFT_WORKERS <= 1:
+        results = [sift.detect_and_compute(img) for img in images]
+        return results, {"workers": 1, "wall_s": round(time.perf_counter() - start, 4)}
+
+    import cv2
+    params = sift_params(sift)
+    blocks, futures = [], {}
+    try:
+        tasks = []
+        for img_idx, img in enumerate(images):
+            base = cv2.GaussianBlur(img, (0, 0), sift.sigma, borderType=cv2.BORDER_REPLICATE)
+            gaussian_pyramid = sift._build_gaussian_pyramid(base)
+            dog_pyramid = sift._build_dog_pyramid(gaussian_pyramid)
+            for octave_idx, (gauss, dog) in enumerate(zip(gaussian_pyramid, dog_pyramid)):
+                g_shm, g_spec = _share(gauss)
+                d_shm, d_spec = _share(dog)
+                blocks += [g_shm, d_shm]
+                tasks.append((gauss[0].size, (img_idx, octave_idx), g_spec, d_spec))
+        pyramid_s = time.perf_counter() - start
+
+        # Largest octaves first for better load balance
+        pool = get_pool()
+        for _, key, g_spec, d_spec in sorted(tasks, key=lambda t: -t[0]):
+            futures[key] = pool.submit(_octave_task, params, key[1], g_spec, d_spec)
+
+        results, task_s = [], 0.0
+        for img_idx in range(len(images)):
+            keypoints, descriptors = [], []
+            octave_keys = sorted(k for k in futures if k[0] == img_idx)
+            for key in octave_keys:
+                kps, desc, elapsed = futures[key].result()
+                keypoints += kps
+                descriptors.append(desc)
+                task_s += elapsed
+            results.append((keypoints, np.vstack(descriptors) if descriptors else np.zeros((0, 128), np.float32)))
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    wall = time.perf_counter() - start
+    stats = {
+        "workers": SIFT_WORKERS,
+        "tasks": len(futures),
+        "wall_s": round(wall, 4),
+        "pyramid_s": round(pyramid_s, 4),
+        "worker_task_s": round(task_s, 4)
+    }
+    if compare_serial:
+        serial_start = time.perf_counter()
+        for img in images:
+            sift.detect_and_compute(img)
+        serial = time.perf_counter() - serial_start
+        stats["serial_s"] = round(serial, 4)
+        stats["speedup"] = round(serial / wall, 2) if wall > 0 else None
+    return results, stats
@@ -4,6 +4,7 @@ import numpy as np
 import base64
 from io import BytesIO
 from PIL import Image
+from modules.common.resolution import request_budget, fit, points_to_original
 
 bp = Blueprint('assignment7', __name__, url_prefix='/assignment7')
 
@@ -30,6 +31,26 @@ def decode_image(base64_string):
         img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
     return img
 
+def find_corners(img, pattern_size, budget, fallback=False):
+    """Chessboard corners in original-image coordinates.
+
+    Detection runs on a copy downscaled to the resolution budget; the back-projected
+    corners are then refined with cornerSubPix on the full-resolution image.
+    """
+    small, scale = fit(img, budget)
+    small_gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    ret, corners = cv2.findChessboardCorners(small_gray, pattern_size, None)
+    if not ret and fallback:
+        # Try adaptive threshold
+        flags = cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE + cv2.CALIB_CB_FAST_CHECK
+        ret, corners = cv2.findChessboardCorners(small_gray, pattern_size, flags)
+    if not ret:
+        return False, None
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if scale < 1.0 else small_gray
+    corners = points_to_original(corners, scale).astype(np.float32)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+    return True, cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
+
 @bp.route('/detect_chessboard', methods=['POST'])
 def detect_chessboard():
     try:
@@ -38,35 +59,13 @@ def detect_chessboard():
         right_img = decode_image(data['right_image'])
         pattern_size = tuple(data['pattern_size'])
         
-        # Resize if too large
-        max_dim = 1920
-        h, w = left_img.shape[:2]
-        if max(h, w) > max_dim:
-            scale = max_dim / max(h, w)
-            left_img = cv2.resize(left_img, (0,0), fx=scale, fy=scale)
-            right_img = cv2.resize(right_img, (0,0), fx=scale, fy=scale)
-
-        left_gray = cv2.cvtColor(left_img, cv2.COLOR_BGR2GRAY)
-        right_gray = cv2.cvtColor(right_img, cv2.COLOR_BGR2GRAY)
-
-        ret_left, corners_left = cv2.findChessboardCorners(left_gray, pattern_size, None)
-        ret_right, corners_right = cv2.findChessboardCorners(right_gray, pattern_size, None)
-
-        if not ret_left or not ret_right:
-            # Try adaptive threshold
-            flags = cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE + cv2.CALIB_CB_FAST_CHECK
-            if not ret_left:
-                ret_left, corners_left = cv2.findChessboardCorners(left_gray, pattern_size, flags)
-            if not ret_right:
-                ret_right, corners_right = cv2.findChessboardCorners(right_gray, pattern_size, flags)
+        budget = request_budget()
+        ret_left, corners_left = find_corners(left_img, pattern_size, budget, fallback=True)
+        ret_right, corners_right = find_corners(right_img, pattern_size, budget, fallback=True)
 
         if not ret_left or not ret_right:
             return jsonify({'success': False, 'error': 'Chessboard not found in one or both images'}), 400
 
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
-        corners_left = cv2.cornerSubPix(left_gray, corners_left, (11, 11), (-1, -1), criteria)
-        corners_right = cv2.cornerSubPix(right_gray, corners_right, (11, 11), (-1, -1), criteria)
-
         return jsonify({
             'success': True,
             'left_corners': corners_left.reshape(-1, 2).tolist(),
@@ -90,6 +89,7 @@ def calibrate():
         objp = create_object_points(pattern_size, square_size)
 
         img_shape = None
+        budget = request_budget()
 
         for pair in image_pairs:
             left_img = decode_image(pair['left'])
@@ -98,17 +98,10 @@ def calibrate():
             if img_shape is None:
                 img_shape = left_img.shape[:2][::-1] # (width, height)
 
-            left_gray = cv2.cvtColor(left_img, cv2.COLOR_BGR2GRAY)
-            right_gray = cv2.cvtColor(right_img, cv2.COLOR_BGR2GRAY)
-
-            ret_left, corners_left = cv2.findChessboardCorners(left_gray, pattern_size, None)
-            ret_right, corners_right = cv2.findChessboardCorners(right_gray, pattern_size, None)
+            ret_left, corners_left = find_corners(left_img, pattern_size, budget)
+            ret_right, corners_right = find_corners(right_img, pattern_size, budget)
 
             if ret_left and ret_right:
-                criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
-                corners_left = cv2.cornerSubPix(left_gray, corners_left, (11, 11), (-1, -1), criteria)
-                corners_right = cv2.cornerSubPix(right_gray, corners_right, (11, 11), (-1, -1), criteria)
-                
                 objpoints.append(objp)
                 imgpoints_left.append(corners_left)
                 imgpoints_right.append(corners_right)
@@ -0,0 +1,217 @@
+import os
+import json
+import math
+import time
+import threading
+
+from flask import g, jsonify, request
+
+# Limits per cost class: concurrent requests per blueprint, bounded wait queue, seconds a
+# request may wait for a slot. 'light' routes are never queued. Override with CV_COST_CLASSES (JSON).
+COST_CLASSES = {
+    'light': None,
+    'medium': {'concurrency': 2, 'queue': 8, 'timeout': 15.0},
+    'heavy': {'concurrency': 1, 'queue': 2, 'timeout': 5.0},
+}
+COST_CLASSES.update(json.loads(os.environ.get('CV_COST_CLASSES', '{}')))
+
+# Cost class per endpoint (blueprint.view); unlisted endpoints default to DEFAULT_COST.
+# Override or extend with CV_ROUTE_COSTS (JSON), e.g. {"assignment3.process": "heavy"}.
+ROUTE_COSTS = {
+    'health_check': 'light',
+    'admission_metrics': 'light',
+    'assignment1.process': 'light',
+    'assignment1.create_calibration': 'light',
+    'assignment1.get_calibration': 'light',
+    'assignment1.measure_batch': 'light',
+    'assignment2.track_templates': 'medium',
+    'assignment2.match_templates': 'medium',
+    'assignment2.deblur_image': 'medium',
+    'assignment3.process': 'medium',
+    'assignment3.aruco_batch': 'medium',
+    'assignment4.index_query': 'medium',
+    'assignment4.index_stats': 'light',
+    'assignment4.sift_demo': 'heavy',
+    'assignment4.stitch_images': 'heavy',
+    'assignment4.index_ingest': 'heavy',
+    'assignment4.index_build': 'heavy',
+}
+ROUTE_COSTS.update(json.loads(os.environ.get('CV_ROUTE_COSTS', '{}')))
+DEFAULT_COST = os.environ.get('CV_DEFAULT_COST', 'medium')
+
+# Gates are per blueprint and class, so their (concurrency + queue) slots add up past the
+# server's thread count. Under gunicorn's gthread workers (CV_WORKER_THREADS, set by
+# gunicorn.conf.py) gated requests, running or queued, may hold at most that many threads
+# minus CV_LIGHT_THREADS; the rest always stay free for light routes such as /api/health.
+WORKER_THREADS = int(os.environ.get('CV_WORKER_THREADS') or 0) or None
+LIGHT_THREADS = int(os.environ.get('CV_LIGHT_THREADS', 2))
+
+# Enforced before any pixels are decoded
+MAX_UPLOAD_MB = float(os.environ.get('CV_MAX_UPLOAD_MB', 64))
+MAX_MEGAPIXELS = float(os.environ.get('CV_MAX_MEGAPIXELS', 100))
+
+class Gate:
+    """Concurrency semaphore with a bounded wait queue and timeout, plus queue-depth metrics."""
+
+    def __init__(self, concurrency, queue, timeout):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.metrics = {"admitted": 0, "queued": 0, "rejected_queue_full": 0,
+                        "rejected_timeout": 0, "max_waiting": 0, "avg_service_s": 0.0}
+
+    def enter(self):
+        """Take a slot. Returns None when admitted, else the HTTP status to reject with."""
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                if self.waiting >= self.queue:
+                    self.metrics["rejected_queue_full"] += 1
+                    return 429
+                self.waiting += 1
+                self.metrics["queued"] += 1
+                self.metrics["max_waiting"] = max(self.metrics["max_waiting"], self.waiting)
+            acquired = self.slots.acquire(timeout=self.timeout)
+            with self.lock:
+                self.waiting -= 1
+                if not acquired:
+                    self.metrics["rejected_timeout"] += 1
+                    return 503
+        with self.lock:
+            self.active += 1
+            self.metrics["admitted"] += 1
+        return None
+
+    def leave(self, started):
+        with self.lock:
+            self.active -= 1
+            # Exponentially weighted service time, used for Retry-After hints
+            self.metrics["avg_service_s"] += 0.2 * (time.perf_counter() - started - self.metrics["avg_service_s"])
+        self.slots.release()
+
+    def retry_after(self):
+        with self.lock:
+            backlog = (self.waiting + self.active) / self.concurrency
+            return max(1, math.ceil(backlog * (self.metrics["avg_service_s"] or self.timeout)))
+
+    def snapshot(self):
+        with self.lock:
+            return {"active": self.active, "waiting": self.waiting, "concurrency": self.concurrency,
+                    "queue": self.queue, **self.metrics}
+
+class ThreadBudget:
+    """Process-wide cap on threads held by gated requests; limit None means unbounded."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.used = 0
+        self.rejected = 0
+
+    def take(self):
+        with self.lock:
+            if self.limit is not None and self.used >= self.limit:
+                self.rejected += 1
+                return False
+            self.used += 1
+            return True
+
+    def give(self):
+        with self.lock:
+            self.used -= 1
+
+    def snapshot(self):
+        with self.lock:
+            return {"limit": self.limit, "used": self.used, "rejected": self.rejected}
+
+thread_budget = ThreadBudget(max(1, WORKER_THREADS - LIGHT_THREADS) if WORKER_THREADS else None)
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+def route_cost(endpoint):
+    return ROUTE_COSTS.get(endpoint, DEFAULT_COST)
+
+def gate_for(blueprint, cost):
+    limits = COST_CLASSES.get(cost)
+    if not limits:
+        return None
+    key = f"{blueprint or 'app'}:{cost}"
+    with _gates_lock:
+        if key not in _gates:
+            _gates[key] = Gate(int(limits['concurrency']), int(limits['queue']), float(limits['timeout']))
+        return _gates[key]
+
+def oversized_upload():
+    """(name, megapixels) of the first uploaded image above MAX_MEGAPIXELS, read from its header only.
+
+    megapixels is None when Pillow refuses the header as a decompression bomb (over twice
+    Image.MAX_IMAGE_PIXELS), which is always above the limit.
+    """
+    from PIL import Image
+    # Keep Pillow's bomb check (which refuses to open at 2x MAX_IMAGE_PIXELS) above our limit
+    if Image.MAX_IMAGE_PIXELS and Image.MAX_IMAGE_PIXELS < MAX_MEGAPIXELS * 1e6:
+        Image.MAX_IMAGE_PIXELS = int(MAX_MEGAPIXELS * 1e6)
+    for key in request.files:
+        for file in request.files.getlist(key):
+            try:
+                with Image.open(file.stream) as im:
+                    w, h = im.size
+            except Image.DecompressionBombError:
+                return file.filename, None
+            except Exception:
+                continue  # not an image PIL can parse; the route reports it
+            finally:
+                file.stream.seek(0)
+            if w * h > MAX_MEGAPIXELS * 1e6:
+                return file.filename, w * h / 1e6
+    return None
+
+def reject(status, message, retry_after=None):
+    resp = jsonify({"error": message})
+    resp.status_code = status
+    if retry_after is not None:
+        resp.headers['Retry-After'] = str(retry_after)
+    return resp
+
+def init_admission(app):
+    app.config['MAX_CONTENT_LENGTH'] = int(MAX_UPLOAD_MB * 1024 * 1024)
+
+    @app.before_request
+    def admit():
+        if request.method == 'OPTIONS':
+            return None
+        if request.files:
+            oversized = oversized_upload()
+            if oversized:
+                name, mp = oversized
+                size = f"{mp:.1f} MP" if mp is not None else "too large to open"
+                return reject(413, f"{name} is {size}; the limit is {MAX_MEGAPIXELS:g} MP")
+        gate = gate_for(request.blueprint, route_cost(request.endpoint))
+        if gate is None:
+            return None
+        if not thread_budget.take():
+            return reject(429, "Server busy, retry later", gate.retry_after())
+        status = gate.enter()
+        if status is not None:
+            thread_budget.give()
+            return reject(status, "Server busy, retry later", gate.retry_after())
+        g.admission = (gate, time.perf_counter())
+        return None
+
+    @app.teardown_request
+    def release(exc):
+        admission = g.pop('admission', None)
+        if admission:
+            admission[0].leave(admission[1])
+            thread_budget.give()
+
+    @app.route('/api/admission/metrics', methods=['GET'])
+    def admission_metrics():
+        with _gates_lock:
+            gates = dict(_gates)
+        return jsonify({"gates": {key: gate.snapshot() for key, gate in gates.items()},
+                        "threads": thread_budget.snapshot()})
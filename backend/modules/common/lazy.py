@@ -0,0 +1,114 @@
+import os
+import time
+import logging
+import importlib
+import threading
+
+from flask import Blueprint, Flask
+
+log = logging.getLogger(__name__)
+
+# Route table per assignment module: url prefix and (rule, view function, methods).
+# Registered as stubs so the app starts without importing OpenCV/NumPy; the module itself
+# is imported on its first request. Endpoint names are the real ones ('assignment3.process'),
+# so admission costs and resolution budgets apply unchanged. Keep in sync with the modules'
+# @bp.route decorators; load() logs any drift and benchmarks/bench_startup.py --check reports it.
+MODULES = {
+    'assignment1': ('/api/assignment1', [
+        ('/process', 'process', ['POST']),
+        ('/calibrations', 'create_calibration', ['POST']),
+        ('/calibrations/<calibration_id>', 'get_calibration', ['GET']),
+        ('/measure', 'measure_batch', ['POST']),
+    ]),
+    'assignment2': ('/api/assignment2', [
+        ('/match', 'match_templates', ['POST']),
+        ('/track', 'track_templates', ['POST']),
+        ('/deblur', 'deblur_image', ['POST']),
+    ]),
+    'assignment3': ('/api/assignment3', [
+        ('/process', 'process', ['POST']),
+        ('/aruco', 'aruco_batch', ['POST']),
+    ]),
+    'assignment4': ('/api/assignment4', [
+        ('/stitch', 'stitch_images', ['POST']),
+        ('/sift', 'sift_demo', ['POST']),
+        ('/index/ingest', 'index_ingest', ['POST']),
+        ('/index/build', 'index_build', ['POST']),
+        ('/index/query', 'index_query', ['POST']),
+        ('/index/stats', 'index_stats', ['GET']),
+    ]),
+    'assignment7': ('/assignment7', [
+        ('/detect_chessboard', 'detect_chessboard', ['POST']),
+        ('/calibrate', 'calibrate', ['POST']),
+        ('/triangulate', 'triangulate', ['POST']),
+        ('/measure', 'measure', ['POST']),
+    ]),
+}
+
+# CV_MODULES: comma-separated modules to serve. CV_LAZY_MODULES=0 imports them at startup.
+ENABLED_MODULES = [m.strip() for m in os.environ.get('CV_MODULES', 'assignment1,assignment2,assignment3,assignment4').split(',') if m.strip()]
+LAZY = os.environ.get('CV_LAZY_MODULES', '1') != '0'
+
+# Seconds each module took to import, filled in on first use
+load_times = {}
+_stubbed = {}
+_load_lock = threading.Lock()
+
+def load(name):
+    """Import an assignment module once and swap its real views in for the stubs on every app."""
+    module_name = f'modules.{name}'
+    with _load_lock:
+        if name in load_times:
+            return importlib.import_module(module_name)
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        threads = os.environ.get('CV_NUM_THREADS')
+        if threads:
+            # Workers forked before OpenCV was imported still get the per-worker thread count
+            import cv2
+            cv2.setNumThreads(int(threads))
+        for app in _stubbed.pop(name, []):
+            for _, view, _ in MODULES[name][1]:
+                app.view_functions[f'{name}.{view}'] = getattr(module, view)
+        load_times[name] = round(time.perf_counter() - start, 4)
+    log.info("Loaded %s in %.2fs", name, load_times[name])
+    drift = check_routes(name, module)
+    if drift:
+        log.warning("Route table for %s is out of date: %s", name, drift)
+    return module
+
+def check_routes(name, module=None):
+    """Differences between MODULES[name] and the module's real blueprint, as sorted strings."""
+    module = module or load(name)
+    scratch = Flask(__name__)
+    scratch.register_blueprint(module.bp)
+    real = {(r.rule, r.endpoint, tuple(sorted(r.methods - {'HEAD', 'OPTIONS'})))
+            for r in scratch.url_map.iter_rules() if r.endpoint != 'static'}
+    prefix, routes = MODULES[name]
+    declared = {(prefix + rule, f'{name}.{view}', tuple(sorted(methods))) for rule, view, methods in routes}
+    return sorted([f"missing stub {r}" for r in real - declared] + [f"no such route {r}" for r in declared - real])
+
+def _stub(name, view):
+    def stub(**kwargs):
+        return getattr(load(name), view)(**kwargs)
+    return stub
+
+def register_modules(app, modules=None, lazy=None):
+    """Register the enabled assignment blueprints: stubs when lazy, real blueprints otherwise."""
+    modules = ENABLED_MODULES if modules is None else modules
+    lazy = LAZY if lazy is None else lazy
+    unknown = [name for name in modules if name not in MODULES]
+    if unknown:
+        raise ValueError(f"Unknown modules in CV_MODULES: {', '.join(unknown)}")
+    for name in modules:
+        if not lazy or name in load_times:
+            app.register_blueprint(load(name).bp)
+            continue
+        prefix, routes = MODULES[name]
+        bp = Blueprint(name, f'modules.{name}', url_prefix=prefix)
+        for rule, view, methods in routes:
+            bp.add_url_rule(rule, view, _stub(name, view), methods=methods)
+        app.register_blueprint(bp)
+        with _load_lock:
+            _stubbed.setdefault(name, []).append(app)
+    return modules
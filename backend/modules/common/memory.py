@@ -0,0 +1,43 @@
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+# Working-set budget per request; anything larger is backed by memory-mapped spool files
+MEMORY_BUDGET = int(float(os.environ.get('CV_MEMORY_BUDGET_MB', 512)) * 1024 * 1024)
+SPOOL_DIR = os.environ.get('CV_SPOOL_DIR') or None
+
+def use_memmap(nbytes, budget=None):
+    return nbytes > (MEMORY_BUDGET if budget is None else budget)
+
+def allocate(shape, dtype, memmap=False):
+    """Uninitialised array in RAM, or backed by an anonymous spool file when memmap is set.
+
+    The spool file is unlinked immediately (TemporaryFile); the mapping keeps it alive
+    until the array is garbage collected, and the OS pages it in and out as needed.
+    """
+    if not memmap:
+        return np.empty(shape, dtype)
+    spool = tempfile.TemporaryFile(dir=SPOOL_DIR)
+    return np.memmap(spool, dtype=dtype, mode='w+', shape=shape)
+
+def decode_upload(file, flags=cv2.IMREAD_COLOR, working_bytes_per_pixel=0, budget=None):
+    """Decode an uploaded image and pick the in-RAM or memmap path for it.
+
+    `working_bytes_per_pixel` is the caller's estimate of its own intermediates.
+    Returns (img, memmap): when the decoded pixels plus that working set exceed the
+    budget, the pixels are copied into a spool file and the RAM copy is released, and
+    the caller should allocate its intermediates with allocate(..., memmap=True).
+    Returns (None, False) if the data cannot be decoded.
+    """
+    img = cv2.imdecode(np.frombuffer(file.read(), np.uint8), flags)
+    if img is None:
+        return None, False
+    pixels = img.shape[0] * img.shape[1]
+    memmap = use_memmap(img.nbytes + pixels * working_bytes_per_pixel, budget)
+    if memmap:
+        spooled = allocate(img.shape, img.dtype, memmap=True)
+        spooled[...] = img
+        img = spooled
+    return img, memmap
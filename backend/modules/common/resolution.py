@@ -0,0 +1,96 @@
+import os
+import json
+import math
+
+from flask import jsonify, request
+
+# app.py imports this module for init_resolution(), so OpenCV and NumPy are imported inside
+# the pixel helpers below and stay out of startup (see modules/common/lazy.py)
+
+# Target working resolution per endpoint, in megapixels. Images above the budget are
+# downscaled once (INTER_AREA) on entry; None means full resolution. Override the table
+# with CV_RESOLUTION_BUDGETS (JSON) and per request with a 'max_megapixels' field
+# (0 or 'full' for full resolution).
+BUDGETS = {
+    'assignment2.match_templates': 2.0,
+    'assignment3.process': 8.0,
+    'assignment3.aruco_batch': 4.0,
+    'assignment4.sift_demo': 0.2,
+    'assignment4.stitch_images': 1.0,
+    'assignment4.index': 0.8,
+    'assignment7.detect_chessboard': 2.0,
+    'assignment7.calibrate': 2.0,
+}
+BUDGETS.update(json.loads(os.environ.get('CV_RESOLUTION_BUDGETS', '{}')))
+
+def parse_budget(value):
+    """'full' or a number <= 0 means full resolution (None); raises ValueError on anything else."""
+    if value == 'full':
+        return None
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(value)
+    return value if value > 0 else None
+
+def _client_budget():
+    value = request.values.get('max_megapixels')
+    if value is None and request.is_json:
+        data = request.get_json(silent=True)
+        value = data.get('max_megapixels') if isinstance(data, dict) else None
+    return value
+
+def request_budget(key=None):
+    """Budget for the current request: client override, else the table entry for key (default: endpoint)."""
+    value = _client_budget()
+    if value is None:
+        return BUDGETS.get(key or request.endpoint)
+    return parse_budget(value)
+
+def init_resolution(app):
+    # Reject a malformed max_megapixels up front, so routes never see it
+    @app.before_request
+    def check_budget():
+        value = _client_budget()
+        if value is None:
+            return None
+        try:
+            parse_budget(value)
+        except (TypeError, ValueError):
+            resp = jsonify({"error": f"max_megapixels must be a number or 'full', got {value!r}"})
+            resp.status_code = 400
+            return resp
+        return None
+
+def fit(img, megapixels):
+    """Downscale img to at most `megapixels` (never upscales). Returns (img, scale) with scale <= 1."""
+    import cv2
+    if not megapixels:
+        return img, 1.0
+    h, w = img.shape[:2]
+    scale = math.sqrt(megapixels * 1e6 / (h * w))
+    if scale >= 1.0:
+        return img, 1.0
+    # With dsize left to OpenCV, fx/fy are used as the exact mapping, so dividing by scale back-projects
+    return cv2.resize(img, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA), scale
+
+# --- Back-projection to original-image coordinates ---
+
+def points_to_original(points, scale):
+    """Sub-pixel point coordinates (pixel-centre convention), any (..., 2) or flat x,y layout."""
+    import numpy as np
+    return (np.asarray(points, dtype=np.float64) + 0.5) / scale - 0.5
+
+def box_to_original(box, scale):
+    # Boxes are pixel-edge extents, so they scale directly
+    x, y, w, h = box
+    return [int(round(x / scale)), int(round(y / scale)), int(round(w / scale)), int(round(h / scale))]
+
+def keypoints_to_original(keypoints, scale):
+    import cv2
+    if scale == 1.0:
+        return keypoints
+    return [cv2.KeyPoint((kp.pt[0] + 0.5) / scale - 0.5, (kp.pt[1] + 0.5) / scale - 0.5, kp.size / scale, kp.angle, kp.response, kp.octave, kp.class_id)
+            for kp in keypoints]
+
+def area_to_original(area, scale):
+    return area / (scale * scale)
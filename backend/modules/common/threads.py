@@ -0,0 +1,6 @@
+import os
+
+def cv_threads():
+    """CPU threads this process may use: CV_NUM_THREADS (gunicorn.conf.py sets it to the
+    per-worker share of the cores), else every core."""
+    return max(1, int(os.environ.get('CV_NUM_THREADS') or 0) or os.cpu_count() or 1)
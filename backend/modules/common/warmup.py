@@ -0,0 +1,70 @@
+import io
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+# Readiness reported by /api/health: flipped once warm-up has run, or at startup when
+# CV_WARMUP=lazy lets warm-up finish in the background after the app reports healthy
+state = {"ready": False, "seconds": None, "failures": {}}
+
+def synthetic_image(size=96):
+    """Small textured BGR image: gradients, shapes and a checker patch so every filter has work to do."""
+    # OpenCV and NumPy are imported here, not at module level, so app startup stays light
+    import cv2
+    import numpy as np
+    yy, xx = np.mgrid[0:size, 0:size]
+    img = np.dstack([(xx * 255 // size), (yy * 255 // size), ((xx + yy) * 127 // size)]).astype(np.uint8)
+    cv2.circle(img, (size // 3, size // 3), size // 6, (255, 255, 255), -1)
+    cv2.rectangle(img, (size // 2, size // 2), (size - 10, size - 10), (0, 0, 0), -1)
+    img[8:24, size - 24:size - 8] = ((np.indices((16, 16)).sum(axis=0) // 4) % 2 * 255)[..., None]
+    return img
+
+def _png(img, name):
+    import cv2
+    _, buf = cv2.imencode('.png', img)
+    return (io.BytesIO(buf.tobytes()), name)
+
+def warmup_requests(img):
+    """(path, form data factory) for the hot path of each blueprint."""
+    import numpy as np
+    shifted = np.roll(img, 8, axis=1)
+    requests = [
+        ('/api/assignment1/process', lambda: {
+            'calib_image': _png(img, 'warmup_calib.png'), 'test_image': _png(img, 'warmup_test.png'),
+            'calib_distance': '50', 'calib_size': '10', 'test_distance': '50',
+            'calib_points': '0,0,10,0', 'test_points': '0,0,20,0'}),
+        ('/api/assignment2/match', lambda: {'image': _png(img, 'warmup.png')}),
+        ('/api/assignment2/deblur', lambda: {'image': _png(img, 'warmup.png'), 'ksize': '5', 'sigma': '1.0'}),
+        ('/api/assignment4/sift', lambda: {'image_a': _png(img, 'warmup_a.png'), 'image_b': _png(shifted, 'warmup_b.png')}),
+    ]
+    for task in ('gradient', 'log', 'edges', 'corners', 'boundary', 'aruco'):
+        requests.append(('/api/assignment3/process', lambda task=task: {'image': _png(img, 'warmup.png'), 'task': task}))
+    return requests
+
+def run_warmup(app):
+    """Exercise every registered blueprint once on a synthetic image, then mark the app ready.
+
+    Failures are recorded and logged but never block readiness; warm-up only moves
+    lazy initialisation (module imports, OpenCV dispatch, detector caches, templates)
+    out of the first request.
+    """
+    start = time.perf_counter()
+    img = synthetic_image()
+    registered = {rule.rule for rule in app.url_map.iter_rules()}
+    with app.test_client() as client:
+        for path, data in warmup_requests(img):
+            if path not in registered:
+                continue
+            form = data()
+            name = f"{path} {form.get('task', '')}".strip()
+            try:
+                resp = client.post(path, data=form, content_type='multipart/form-data')
+                if resp.status_code >= 500:
+                    state["failures"][name] = resp.get_json(silent=True)
+            except Exception as e:
+                state["failures"][name] = str(e)
+    state["seconds"] = round(time.perf_counter() - start, 3)
+    state["ready"] = True
+    log.info("Warm-up finished in %.2fs (%d failures)", state["seconds"], len(state["failures"]))
+    return state